@@ -1,16 +1,1436 @@
+import base64
+import fcntl
+import gzip
+import hashlib
+import io
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import wraps
+
+import numpy as np
 import pandas as pd
 import dash
-from dash import dcc, html
-from dash.dependencies import Input, Output
-import plotly.express as px
+from dash import Patch, dcc, html, no_update
+from dash.dependencies import ALL, MATCH, Input, Output, State
+from flask import Response, g, request
+import plotly.graph_objects as go
+from plotly.io.json import to_json_plotly
+
+import sqlite_backend
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Instantané en pickle et export CSV seul sans pyarrow
+    pa = pq = None
+
+try:
+    import brotli
+except ImportError:  # Réponses compressées en gzip seul sans brotli
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+
+# =======================
+# Instrumentation
+# =======================
+
+# Mesures désactivées par défaut : les fonctions ne sont alors pas décorées
+METRICS_ENABLED = os.environ.get("DASHBOARD_METRICS", "0") == "1"
+# Seuil (ms) au-delà duquel un callback est journalisé avec ses filtres
+SLOW_CALLBACK_MS = float(os.environ.get("DASHBOARD_SLOW_CALLBACK_MS", "0"))
+
+SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BYTES_BUCKETS = (1_000, 10_000, 50_000, 100_000, 500_000, 1_000_000, 5_000_000)
+
+# nom -> {labels -> [compteurs par seau, somme, nombre]}
+HISTOGRAMS = {}
+COUNTERS = {}
+GAUGES = {}
+METRICS_LOCK = threading.Lock()
+
+
+def observe(name, labels, value, buckets=SECONDS_BUCKETS):
+    """Record ``value`` in the Prometheus-style histogram ``name``."""
+    with METRICS_LOCK:
+        series = HISTOGRAMS.setdefault(name, {}).setdefault(
+            labels, [[0] * len(buckets), 0.0, 0, buckets]
+        )
+        for index, bound in enumerate(buckets):
+            if value <= bound:
+                series[0][index] += 1
+        series[1] += value
+        series[2] += 1
+
+
+def increment(name, labels, value=1):
+    with METRICS_LOCK:
+        counters = COUNTERS.setdefault(name, {})
+        counters[labels] = counters.get(labels, 0) + value
+
+
+def set_gauge(name, labels, value):
+    """Set the gauge ``name``; ``None`` removes the series."""
+    with METRICS_LOCK:
+        gauges = GAUGES.setdefault(name, {})
+        if value is None:
+            gauges.pop(labels, None)
+        else:
+            gauges[labels] = value
+
+
+def timed(stage):
+    """Time every call of the decorated function as ``stage``.
+
+    Without ``DASHBOARD_METRICS=1`` the function is returned untouched, so
+    the instrumentation costs nothing.
+    """
+
+    def decorator(func):
+        if not METRICS_ENABLED:
+            return func
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                observe(
+                    "dashboard_stage_seconds",
+                    (("stage", stage),),
+                    time.perf_counter() - start,
+                )
+
+        return wrapper
+
+    return decorator
+
+
+def label_value(value):
+    """``value`` escaped as the text exposition format requires."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{label_value(value)}"' for key, value in pairs) + "}"
+
+
+def render_metrics():
+    """Text exposition format of every histogram, counter and gauge.
+
+    The measures are kept per process: every series carries the ``pid`` of
+    the worker that answered (one scrape sees a single gunicorn worker).
+    """
+    process = [("pid", os.getpid())]
+    lines = []
+    with METRICS_LOCK:
+        for name, series in sorted(HISTOGRAMS.items()):
+            lines.append(f"# TYPE {name} histogram")
+            for labels, (counts, total, count, buckets) in sorted(series.items()):
+                labels = list(labels) + process
+                for bound, bucket_count in zip(buckets, counts):
+                    lines.append(
+                        f"{name}_bucket{format_labels(labels, [('le', bound)])} "
+                        f"{bucket_count}"
+                    )
+                lines.append(
+                    f"{name}_bucket{format_labels(labels, [('le', '+Inf')])} {count}"
+                )
+                lines.append(f"{name}_sum{format_labels(labels)} {total}")
+                lines.append(f"{name}_count{format_labels(labels)} {count}")
+        for name, series in sorted(COUNTERS.items()):
+            lines.append(f"# TYPE {name} counter")
+            for labels, value in sorted(series.items()):
+                lines.append(f"{name}{format_labels(labels, process)} {value}")
+        for name, series in sorted(GAUGES.items()):
+            lines.append(f"# TYPE {name} gauge")
+            for labels, value in sorted(series.items()):
+                lines.append(f"{name}{format_labels(labels, process)} {value}")
+    return "\n".join(lines) + "\n"
+
 
 # =======================
 # Chargement des données
 # =======================
 
-df = pd.read_csv("supermarket_sales.csv")
-df["Date"] = pd.to_datetime(df["Date"])
-df["Month"] = df["Date"].dt.strftime("%Y-%U")  # Semaine
+DATA_PATH = os.environ.get("DASHBOARD_DATA", "supermarket_sales.csv")
+# Dossier des instantanés binaires (vide : désactivé)
+SNAPSHOT_DIR = os.environ.get("DASHBOARD_SNAPSHOT_DIR", ".cache")
+# "pandas" (tout en mémoire) ou "sqlite" (filtres et agrégats en SQL)
+BACKEND = os.environ.get("DASHBOARD_BACKEND", "pandas")
+# Base SQLite (vide : <dossier des instantanés>/<nom du CSV>.sqlite)
+SQLITE_PATH = os.environ.get("DASHBOARD_SQLITE_PATH", "")
+# Lignes lues à la fois lors des chargements par morceaux (SQLite, flux)
+INGEST_CHUNK_ROWS = int(os.environ.get("DASHBOARD_INGEST_CHUNK_ROWS", "500000"))
+# Période (s) de suivi des nouvelles ventes (0 : désactivé)
+LIVE_SECONDS = float(os.environ.get("DASHBOARD_LIVE_SECONDS", "0"))
+# Dossier où déposer des fichiers CSV de nouvelles ventes (vide : aucun)
+DROP_DIR = os.environ.get("DASHBOARD_DROP_DIR", "")
+# Taille du CSV (Mo) à partir de laquelle il est lu par morceaux et ses
+# colonnes déversées sur disque (0 : toujours, vide : jamais)
+STREAM_THRESHOLD_MB = os.environ.get("DASHBOARD_STREAM_THRESHOLD_MB", "512")
+
+# Seules les colonnes utilisées par le tableau de bord sont chargées
+USECOLS = [
+    "Invoice ID",
+    "Branch",
+    "City",
+    "Customer type",
+    "Gender",
+    "Product line",
+    "Total",
+    "Date",
+    "Payment",
+]
+CATEGORICAL_COLUMNS = [
+    "Branch",
+    "City",
+    "Customer type",
+    "Gender",
+    "Product line",
+    "Payment",
+]
+
+# Version du format des instantanés (à incrémenter si parse_sales change)
+SNAPSHOT_VERSION = 3
+
+# Fonctions appelées avec le jeu de données à chaque (re)chargement ou
+# ajout de ventes (vidage des caches, ...)
+RELOAD_HOOKS = []
+
+
+def derive_columns(data):
+    # Les périodes de la courbe (semaines, mois, ...) sont dérivées des
+    # dates du cube, cf. build_calendar
+    data["Date"] = pd.to_datetime(data["Date"])
+    return data
+
+
+class FilePrefix(io.RawIOBase):
+    """The first ``size`` bytes of the binary file ``f``, as a stream."""
+
+    def __init__(self, f, size):
+        self.f, self.left = f, size
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        count = self.f.readinto(memoryview(buffer)[: self.left])
+        self.left -= count
+        return count
+
+
+def complete_size(path, size):
+    """Bytes of the complete lines (ended by ``\\n``) among the first
+    ``size`` bytes of ``path``."""
+    with open(path, "rb") as f:
+        end = size
+        while end > 0:
+            start = max(end - (1 << 16), 0)
+            f.seek(start)
+            newline = f.read(end - start).rfind(b"\n")
+            if newline >= 0:
+                return start + newline + 1
+            end = start
+    return 0
+
+
+def parse_sales(path, size=None):
+    """Read the sales CSV (its first ``size`` bytes if given) and derive the
+    columns used by the dashboard."""
+    with open(path, "rb") as f:
+        source = f if size is None else io.BufferedReader(FilePrefix(f, size))
+        data = derive_columns(
+            pd.read_csv(
+                source,
+                usecols=USECOLS,
+                dtype={column: "category" for column in CATEGORICAL_COLUMNS},
+            )
+        )
+
+    # Ordre d'apparition des valeurs dans le fichier (ordre des listes
+    # déroulantes et des traces), conservé malgré le tri par date
+    order = {column: data[column].unique().tolist() for column in CATEGORICAL_COLUMNS}
+    data = data.sort_values("Date", kind="stable", ignore_index=True)
+    data.attrs["order"] = order
+    return data
+
+
+def read_chunks(path):
+    """Parsed chunks of ``INGEST_CHUNK_ROWS`` rows of the sales CSV."""
+    for chunk in pd.read_csv(
+        path,
+        usecols=USECOLS,
+        dtype={column: "category" for column in CATEGORICAL_COLUMNS},
+        chunksize=INGEST_CHUNK_ROWS,
+    ):
+        yield derive_columns(chunk)
+
+
+def file_digest(path, size=None):
+    """SHA-256 of ``path``, or of its first ``size`` bytes."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        source = f if size is None else FilePrefix(f, size)
+        for block in iter(lambda: source.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def source_stamp(path, stat):
+    return {
+        "mtime": stat.st_mtime_ns,
+        "size": stat.st_size,
+        "sha256": file_digest(path),
+    }
+
+
+def matches_source(meta, path, stat):
+    """Whether ``meta`` was built from the current content of ``path``.
+
+    Same mtime and size, or same size and content hash.
+    """
+    return meta.get("size") == stat.st_size and (
+        meta.get("mtime") == stat.st_mtime_ns or meta.get("sha256") == file_digest(path)
+    )
+
+
+def snapshot_paths(path):
+    name = os.path.splitext(os.path.basename(path))[0]
+    extension = "feather" if pa is not None else "pkl"
+    base = os.path.join(SNAPSHOT_DIR, name)
+    return f"{base}.{extension}", f"{base}.json"
+
+
+def read_snapshot(snapshot):
+    if snapshot.endswith(".feather"):
+        return pd.read_feather(snapshot)
+    return pd.read_pickle(snapshot)
+
+
+def write_snapshot(data, snapshot):
+    # Écriture dans un fichier temporaire puis renommage : plusieurs workers
+    # peuvent reconstruire l'instantané en même temps sans se gêner.
+    tmp = f"{snapshot}.{os.getpid()}.tmp"
+    if snapshot.endswith(".feather"):
+        data.to_feather(tmp)
+    else:
+        data.to_pickle(tmp)
+    os.replace(tmp, snapshot)
+
+
+def write_json(content, path):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(content, f)
+    os.replace(tmp, path)
+
+
+@timed("load")
+def read_sales(path, stat, size):
+    """Load the first ``size`` bytes of the sales CSV, going through the
+    binary snapshot when possible.
+
+    ``stat`` was taken before the read. The snapshot is reused as long as
+    the CSV keeps the same mtime and size. When only the mtime changed,
+    the content hash decides whether the CSV really has to be parsed again.
+    """
+    if not SNAPSHOT_DIR:
+        return parse_sales(path, size)
+
+    snapshot, meta_path = snapshot_paths(path)
+    meta = {}
+    if os.path.exists(snapshot) and os.path.exists(meta_path):
+        with open(meta_path) as f:
+            meta = json.load(f)
+
+    reusable = meta.get("version") == SNAPSHOT_VERSION
+    if reusable and meta.get("size") == size:
+        if meta.get("mtime") != stat.st_mtime_ns:
+            reusable = meta.get("sha256") == file_digest(path, size)
+            if reusable:
+                write_json(dict(meta, mtime=stat.st_mtime_ns), meta_path)
+        if reusable:
+            data = read_snapshot(snapshot)
+            data.attrs["order"] = meta["order"]
+            return data
+
+    data = parse_sales(path, size)
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    write_snapshot(data, snapshot)
+    write_json(
+        {
+            "version": SNAPSHOT_VERSION,
+            "mtime": stat.st_mtime_ns,
+            "size": size,
+            "sha256": file_digest(path, size),
+            "order": data.attrs["order"],
+        },
+        meta_path,
+    )
+    return data
+
+
+def sqlite_path(path):
+    if SQLITE_PATH:
+        return SQLITE_PATH
+    name = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(SNAPSHOT_DIR or ".cache", f"{name}.sqlite")
+
+
+@timed("load")
+def open_database(path):
+    """Meta of the SQLite copy of ``path``, ingested again when stale.
+
+    Same freshness rules as ``read_sales``: mtime and size, then the content
+    hash when only the mtime changed. The CSV is read in chunks of
+    ``INGEST_CHUNK_ROWS`` rows, so it never has to fit in memory.
+    """
+    db_path = sqlite_path(path)
+    stat = os.stat(path)
+    meta = sqlite_backend.read_meta(db_path)
+    if meta.get("version") == sqlite_backend.SCHEMA_VERSION and matches_source(
+        meta, path, stat
+    ):
+        return db_path, meta
+
+    os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+    meta = sqlite_backend.ingest(
+        read_chunks(path),
+        db_path,
+        columns=USECOLS,
+        indexes=["City", "Gender", "Date"],
+        source=source_stamp(path, stat),
+    )
+    return db_path, meta
+
+
+# =======================
+# Cube d'agrégats
+# =======================
+
+CUBE_KEYS = ["Date", "City", "Gender"]
+
+
+@timed("groupby_cube")
+def build_cube(data, extra_keys=()):
+    """Pre-aggregate sales per (Date, City, Gender), sorted by date.
+
+    ``extra_keys`` adds dimensions to the group keys. Each row holds the sum
+    of ``Total``, the number of invoices and the number of distinct invoices
+    of its group. An invoice belongs to a single group, so the distinct
+    counts can be summed across groups. Without the ``Invoice ID`` column
+    (memory-mapped columns), each row counts as one invoice.
+    """
+    if "Invoice ID" in data:
+        invoices = [("Invoice ID", "count"), ("Invoice ID", "nunique")]
+    else:
+        invoices = [("Total", "size")] * 2
+    return (
+        data.groupby(CUBE_KEYS + list(extra_keys), observed=True, sort=True)
+        .agg(
+            Total=("Total", "sum"),
+            Invoices=invoices[0],
+            DistinctInvoices=invoices[1],
+        )
+        .reset_index()
+    )
+
+
+def count_invoices(filtered_cube, keys):
+    """Invoice counts per ``keys``, in the layout expected by the bar chart."""
+    return (
+        filtered_cube.groupby(keys, observed=True)["Invoices"]
+        .sum()
+        .reset_index()
+        .rename(columns={"Invoices": "Invoice ID"})
+    )
+
+
+# Résolutions de la courbe d'évolution : libellé du sélecteur, titre, axe
+# et format (d3) des dates de début des périodes au survol
+RESOLUTIONS = {
+    "day": {
+        "label": "Jour",
+        "title": "par jour",
+        "axis": "Temps (Jour)",
+        "format": "%d/%m/%Y",
+    },
+    "week": {
+        "label": "Semaine",
+        "title": "par semaine",
+        "axis": "Temps (Semaine)",
+        "format": "semaine du %d/%m/%Y",
+    },
+    "month": {
+        "label": "Mois",
+        "title": "par mois",
+        "axis": "Temps (Mois-Année)",
+        "format": "%m/%Y",
+    },
+    "quarter": {
+        "label": "Trimestre",
+        "title": "par trimestre",
+        "axis": "Temps (Trimestre)",
+        "format": "T%q %Y",
+    },
+}
+DEFAULT_RESOLUTION = "month"
+
+
+def period_starts(resolution, periods):
+    """First days of the integer ``periods`` (counted from 1970) of ``resolution``."""
+    if resolution == "day":
+        return periods.astype("datetime64[D]")
+    if resolution == "week":
+        return (periods * 7 - 3).astype("datetime64[D]")
+    if resolution == "quarter":
+        periods = periods * 3
+    return periods.astype("datetime64[M]").astype("datetime64[D]")
+
+
+def build_calendar(first, last):
+    """Integer rollup keys of the days from ``first`` to ``last``.
+
+    For each resolution, ``codes[i]`` is the period (0, 1, ...) of the day
+    ``start + i`` and ``starts[p]`` the first day of the period ``p``: the
+    line chart adds up the cube on these codes, without formatting dates.
+    Weeks are ISO weeks (Monday to Sunday).
+    """
+    if first is None:
+        days = np.empty(0, dtype="datetime64[D]")
+    else:
+        days = np.arange(
+            np.datetime64(first, "D"),
+            np.datetime64(last, "D") + 1,
+            dtype="datetime64[D]",
+        )
+    numbers = days.astype(np.int64)
+    months = days.astype("datetime64[M]").astype(np.int64)
+    # Jours, semaines (le 5 janvier 1970 est un lundi), mois et trimestres
+    # écoulés depuis 1970
+    keys = {
+        "day": numbers,
+        "week": (numbers + 3) // 7,
+        "month": months,
+        "quarter": months // 3,
+    }
+    calendar = {"start": days[0] if len(days) else None}
+    for resolution, key in keys.items():
+        periods = np.arange(key[0], key[-1] + 1) if len(key) else key
+        calendar[resolution] = {
+            "codes": (key - key[0] if len(key) else key).astype(np.int32),
+            "starts": period_starts(resolution, periods),
+        }
+    return calendar
+
+
+def rollup(cube, calendar, resolution):
+    """Sums of ``Total`` per period of ``resolution`` and per city of ``cube``.
+
+    Returns the first days of the periods, the cities (in the order of
+    their categories), the sums as a (periods, cities) array and the mask
+    of the pairs present in ``cube``: a single ``np.bincount`` on the
+    integer codes of ``calendar``, whatever the resolution.
+    """
+    starts = calendar[resolution]["starts"]
+    cities, city_values = pd.factorize(cube["City"], sort=True)
+    city_values = np.asarray(city_values, dtype=object)
+    shape = (len(starts), len(city_values))
+    if cube.empty:
+        return starts, city_values, np.zeros(shape), np.zeros(shape, bool)
+
+    days = cube["Date"].to_numpy().astype("datetime64[D]")
+    # Un cube lu pendant un rechargement peut déborder du nouveau calendrier :
+    # son résultat n'est jamais servi (cf. memoize)
+    codes = np.take(
+        calendar[resolution]["codes"],
+        (days - calendar["start"]).astype(np.int64),
+        mode="clip",
+    )
+    keys = codes.astype(np.int64) * shape[1] + cities
+    size = shape[0] * shape[1]
+    totals = np.bincount(keys, weights=cube["Total"].to_numpy(float), minlength=size)
+    present = np.bincount(keys, minlength=size) > 0
+    return starts, city_values, totals.reshape(shape), present.reshape(shape)
+
+
+# =======================
+# Index bitmap des filtres
+# =======================
+
+# Dimensions filtrables : une liste déroulante et un bitmap par valeur
+# chacune. Ajouter une dimension ici suffit à l'ajouter au tableau de bord.
+DIMENSIONS = [
+    {"column": "City", "placeholder": "Sélectionner la ville"},
+    {"column": "Gender", "placeholder": "Sélectionner le genre"},
+    {"column": "Branch", "placeholder": "Sélectionner l'agence"},
+    {"column": "Customer type", "placeholder": "Sélectionner le type de client"},
+    {"column": "Product line", "placeholder": "Sélectionner la gamme de produits"},
+    {"column": "Payment", "placeholder": "Sélectionner le moyen de paiement"},
+]
+FILTER_DIMENSIONS = [dim["column"] for dim in DIMENSIONS]
+# Dimensions qui pilotent aussi les couleurs, motifs et titres des graphiques
+DISPLAY_DIMENSIONS = ["City", "Gender"]
+
+
+def build_bitmap_index(data, dimensions):
+    """One packed bitset (``np.packbits``) per distinct value of each dimension."""
+    index = {}
+    for dim in dimensions:
+        column = data[dim]
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            codes, values = column.cat.codes.to_numpy(), column.cat.categories
+        else:
+            codes, values = pd.factorize(column)
+        index[dim] = {
+            value: np.packbits(codes == code) for code, value in enumerate(values)
+        }
+    return index
+
+
+def select_rows(dataset, filters):
+    """Packed selection of the rows of ``dataset.df`` matching ``filters``.
+
+    ``filters`` maps a dimension to its selected values: bitsets are OR-ed
+    within a dimension and AND-ed across dimensions. A dimension whose
+    every value is selected is skipped, and ``None`` means every row.
+    """
+    selection = None
+    for dim, values in filters.items():
+        bitsets = dataset.bitmap_index[dim]
+        if set(values) >= set(bitsets):
+            continue
+        dim_bits = np.zeros((len(dataset.df) + 7) // 8, dtype=np.uint8)
+        for value in values:
+            if value in bitsets:
+                np.bitwise_or(dim_bits, bitsets[value], out=dim_bits)
+        if selection is None:
+            selection = dim_bits
+        else:
+            np.bitwise_and(selection, dim_bits, out=selection)
+    return selection
+
+
+def selection_mask(selection, start, stop):
+    """Boolean mask of the rows ``start:stop`` of a packed selection.
+
+    Only the bytes covering the slice are unpacked; an empty or inverted
+    slice gives an empty mask.
+    """
+    stop = max(stop, start)
+    offset = start % 8
+    chunk = selection[start // 8 : (stop + 7) // 8]
+    return np.unpackbits(chunk, count=offset + stop - start)[offset:].view(bool)
+
+
+def date_slice(dates, date_key):
+    """Positions ``start:stop`` of the dates of ``date_key`` in sorted ``dates``.
+
+    ``date_key`` is ``()`` for the whole history, or the first and last
+    days (ISO strings) of the range, both included. A range whose last day
+    comes before its first gives an empty slice (``stop == start``).
+    """
+    if not date_key:
+        return 0, len(dates)
+    values = dates.to_numpy()
+    first, last = (np.datetime64(day, "D") for day in date_key)
+    start = np.searchsorted(values, first.astype(values.dtype), side="left")
+    stop = np.searchsorted(
+        values, (last + np.timedelta64(1, "D")).astype(values.dtype), side="left"
+    )
+    return int(start), int(max(stop, start))
+
+
+# =======================
+# Données partagées entre workers
+# =======================
+
+# Dossier des colonnes projetées en mémoire du jeu de données par défaut
+# (vide : chaque worker charge sa propre copie). Le processus maître de
+# gunicorn le remplit, cf. gunicorn.conf.py.
+SHARED_DIR = os.environ.get("DASHBOARD_SHARED_DIR", "")
+
+
+def publish_shared(directory):
+    """Write the default dataset as memory-mappable files in ``directory``.
+
+    Every column is dumped as a raw array: category codes, datetimes as
+    int64 and strings (with ``dataset.text_columns``) as fixed-width bytes.
+    The manifest is written last, so workers never see a half-written
+    dataset.
+    """
+    dataset = get_dataset()
+    df, cube = dataset.df, dataset.cube
+    os.makedirs(directory, exist_ok=True)
+    generation = f"{os.getpid()}-{time.time_ns()}"
+    columns = {}
+    for index, name in enumerate(df.columns):
+        column = df[name]
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            values = column.cat.codes.to_numpy()
+            meta = {"kind": "category", "categories": column.cat.categories.tolist()}
+        elif pd.api.types.is_datetime64_any_dtype(column.dtype):
+            values = column.to_numpy().view("int64")
+            meta = {"kind": "datetime", "unit": str(column.dtype)}
+        elif pd.api.types.is_numeric_dtype(column.dtype):
+            values = column.to_numpy()
+            meta = {"kind": "numeric"}
+        else:
+            values = np.array(column.astype(str).str.encode("utf-8").tolist())
+            meta = {"kind": "bytes"}
+        meta.update(file=f"{generation}-{index}.bin", dtype=values.dtype.str)
+        values.tofile(os.path.join(directory, meta["file"]))
+        columns[name] = meta
+    # Colonnes de texte gardées hors de df (chargement par morceaux, ou
+    # données déjà partagées)
+    for index, (name, values) in enumerate(dataset.text_columns.items(), len(columns)):
+        meta = {
+            "kind": "bytes",
+            "file": f"{generation}-{index}.bin",
+            "dtype": values.dtype.str,
+        }
+        np.asarray(values).tofile(os.path.join(directory, meta["file"]))
+        columns[name] = meta
+
+    cube_file = os.path.basename(snapshot_paths(f"{generation}-cube")[0])
+    write_snapshot(cube, os.path.join(directory, cube_file))
+    write_json(
+        {
+            "rows": len(df),
+            "columns": columns,
+            "cube": cube_file,
+            "order": df.attrs["order"],
+        },
+        os.path.join(directory, "manifest.json"),
+    )
+
+    # Suppression des générations précédentes
+    for file in os.listdir(directory):
+        if file != "manifest.json" and not file.startswith(f"{generation}-"):
+            os.remove(os.path.join(directory, file))
+
+
+def attach_shared(directory):
+    """Map the columns published by ``publish_shared``, without copying them.
+
+    Returns the sales, the cube and the string columns: those are mapped
+    as raw fixed-width bytes, outside of the DataFrame (only the exports
+    read them, a slice at a time).
+    """
+    with open(os.path.join(directory, "manifest.json")) as f:
+        manifest = json.load(f)
+    rows = manifest["rows"]
+    data = {}
+    text_columns = {}
+    for name, column in manifest["columns"].items():
+        if rows:
+            values = np.memmap(
+                os.path.join(directory, column["file"]),
+                dtype=column["dtype"],
+                mode="r",
+                shape=(rows,),
+            )
+        else:
+            values = np.empty(0, dtype=column["dtype"])
+        if column["kind"] == "category":
+            values = pd.Categorical.from_codes(
+                values, categories=column["categories"], validate=False
+            )
+        elif column["kind"] == "datetime":
+            values = values.view(column["unit"])
+        elif column["kind"] == "bytes":
+            text_columns[name] = values
+            continue
+        data[name] = values
+    shared_cube = read_snapshot(os.path.join(directory, manifest["cube"]))
+    shared_df = pd.DataFrame(data, copy=False)
+    shared_df.attrs["order"] = manifest["order"]
+    return shared_df, shared_cube, text_columns
+
+
+# =======================
+# Chargement par morceaux
+# =======================
+
+# Version du format des colonnes déversées (à incrémenter si spill_sales change)
+STREAM_VERSION = 4
+# Nanosecondes d'un jour, et valeur entière des dates manquantes
+DAY_NS = 86_400 * 10**9
+NAT_NS = np.iinfo(np.int64).min
+
+
+def streams(path):
+    """Whether ``path`` is large enough to be loaded by ``stream_sales``."""
+    if not STREAM_THRESHOLD_MB:
+        return False
+    return os.path.getsize(path) >= float(STREAM_THRESHOLD_MB) * 1024 * 1024
+
+
+def spill_dir(path):
+    name = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(SNAPSHOT_DIR or ".cache", f"{name}-columns")
+
+
+@timed("load")
+def stream_sales(path, directory):
+    """Load a CSV too large for ``pd.read_csv`` through bounded memory.
+
+    The columns are spilled to ``directory`` by ``spill_sales``, then
+    memory-mapped by ``attach_shared``; the files are reused as long as the
+    CSV does not change. Loads of the same CSV (one per worker) take turns
+    on a lock of ``directory``: the first one writes the files, the next
+    ones map them.
+    """
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, "lock"), "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        stat = os.stat(path)
+        manifest_path = os.path.join(directory, "manifest.json")
+        manifest = {}
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+        if manifest.get("version") != STREAM_VERSION or not matches_source(
+            manifest, path, stat
+        ):
+            spill_sales(path, directory, stat)
+        return attach_shared(directory)
+
+
+def spill_sales(path, directory, stat):
+    """Write the columns of ``path`` to ``directory``, in the format of
+    ``publish_shared``, through bounded memory.
+
+    Each chunk of ``read_chunks`` is folded into a partial cube and its
+    columns are appended to raw files. The rows are then sorted by date
+    without loading them: a counting sort by day, chunk by chunk, writes
+    each column to its sorted place in a memory-mapped file (memory: one
+    chunk and one counter per day). ``Invoice ID`` is spilled as
+    fixed-width bytes, for the exports only. Distinct invoices are counted
+    per chunk, so an invoice must not span two rows. ``stat`` was taken
+    before the read; the caller holds the lock of ``directory``.
+    """
+    generation = f"{os.getpid()}-{time.time_ns()}"
+    names = list(USECOLS)
+    categorical = CATEGORICAL_COLUMNS
+    spills = {
+        name: open(os.path.join(directory, f"{generation}-{name}.spill"), "wb")
+        for name in names
+    }
+    # Valeurs des catégories dans l'ordre d'apparition : codes globaux
+    codes = {name: {} for name in categorical}
+    partial_cubes = []
+    # Lignes et largeur (octets) des identifiants de chaque morceau
+    chunk_rows, text_widths = [], []
+    # Premier et dernier jours de chaque morceau, et présence d'heures
+    day_ranges, intraday = [], False
+    rows = 0
+    try:
+        for chunk in read_chunks(path):
+            partial_cubes.append(build_cube(chunk))
+            for name in names:
+                column = chunk[name]
+                if name in codes:
+                    known = codes[name]
+                    for value in column.unique().dropna():
+                        known.setdefault(value, len(known))
+                    lookup = np.array(
+                        [known.get(value, -1) for value in column.cat.categories]
+                        + [-1],
+                        dtype=np.int32,
+                    )
+                    values = lookup[column.cat.codes.to_numpy()]
+                elif name == "Date":
+                    values = column.to_numpy().astype("datetime64[ns]").view("int64")
+                    known_dates = values[values != NAT_NS]
+                    if len(known_dates):
+                        days = known_dates // DAY_NS
+                        day_ranges.append((int(days.min()), int(days.max())))
+                        intraday = intraday or bool((known_dates % DAY_NS).any())
+                elif name == "Invoice ID":
+                    values = np.array(
+                        column.astype(str).str.encode("utf-8").tolist(), dtype=bytes
+                    )
+                    text_widths.append(values.dtype.itemsize)
+                else:
+                    values = column.to_numpy(dtype=float)
+                values.tofile(spills[name])
+            chunk_rows.append(len(chunk))
+            rows += len(chunk)
+    finally:
+        for spill in spills.values():
+            spill.close()
+
+    spans = list(itertools.pairwise(np.cumsum([0] + chunk_rows).tolist()))
+
+    def spilled(name, dtype=None):
+        # Morceaux déversés de la colonne, relus dans l'ordre (sans dtype :
+        # identifiants, à la largeur de leur morceau)
+        if dtype is None:
+            dtypes = [f"S{width}" for width in text_widths]
+        else:
+            dtypes = [dtype] * len(chunk_rows)
+        with open(os.path.join(directory, f"{generation}-{name}.spill"), "rb") as f:
+            for count, dtype in zip(chunk_rows, dtypes):
+                yield np.fromfile(f, dtype=dtype, count=count)
+
+    def write_sorted(file, dtype, chunks):
+        # Chaque morceau écrit à ses positions triées
+        file = os.path.join(directory, file)
+        if not rows:
+            np.empty(0, dtype=dtype).tofile(file)
+            return
+        values = np.memmap(file, dtype=dtype, mode="w+", shape=(rows,))
+        for (start, stop), chunk in zip(spans, chunks):
+            values[positions[start:stop]] = chunk
+        values.flush()
+        del values
+
+    def scratch(name):
+        file = os.path.join(directory, f"{generation}-{name}.spill")
+        return np.memmap(file, dtype=np.int64, mode="w+", shape=(max(rows, 1),))
+
+    # Tri par dénombrement : un paquet par jour, les dates manquantes en
+    # dernier (comme sort_values), l'ordre du fichier conservé dans un jour
+    first_day = min((first for first, _ in day_ranges), default=0)
+    last_day = max((last for _, last in day_ranges), default=-1)
+    buckets = last_day - first_day + 2
+
+    def day_buckets(dates):
+        bucket = np.full(len(dates), buckets - 1, dtype=np.int64)
+        known = dates != NAT_NS
+        bucket[known] = dates[known] // DAY_NS - first_day
+        return bucket
+
+    counts = np.zeros(buckets, dtype=np.int64)
+    for dates in spilled("Date", np.int64):
+        counts += np.bincount(day_buckets(dates), minlength=buckets)
+    ends = np.cumsum(counts)
+    cursors = ends - counts
+    positions = scratch("positions")
+    for (start, stop), dates in zip(spans, spilled("Date", np.int64)):
+        bucket = day_buckets(dates)
+        order = np.argsort(bucket, kind="stable")
+        sorted_buckets = bucket[order]
+        rank = np.arange(len(bucket)) - np.searchsorted(sorted_buckets, sorted_buckets)
+        chunk_positions = np.empty(len(bucket), dtype=np.int64)
+        chunk_positions[order] = cursors[sorted_buckets] + rank
+        positions[start:stop] = chunk_positions
+        cursors += np.bincount(bucket, minlength=buckets)
+
+    if intraday:
+        # Heures : chaque jour trié à sa place, un jour à la fois
+        write_sorted(f"{generation}-days.spill", np.int64, spilled("Date", np.int64))
+        by_day = np.memmap(
+            os.path.join(directory, f"{generation}-days.spill"),
+            dtype=np.int64,
+            mode="r",
+            shape=(rows,),
+        )
+        relocate = scratch("relocate")
+        for start, stop in zip((ends - counts).tolist(), ends.tolist()):
+            if stop - start > 1:
+                order = np.argsort(by_day[start:stop], kind="stable")
+                relocate[start + order] = np.arange(start, stop)
+            else:
+                relocate[start:stop] = np.arange(start, stop)
+        for start, stop in spans:
+            positions[start:stop] = relocate[positions[start:stop]]
+        del by_day, relocate
+        for name in ("days", "relocate"):
+            os.remove(os.path.join(directory, f"{generation}-{name}.spill"))
+
+    # Colonnes écrites triées, une à la fois ; catégories triées comme
+    # celles de pd.read_csv
+    categories = {}
+    columns = {}
+    for index, name in enumerate(names):
+        if name in codes:
+            appearance = list(codes[name])
+            categories[name] = sorted(appearance)
+            position = {value: i for i, value in enumerate(categories[name])}
+            remap = np.array(
+                [position[value] for value in appearance] + [-1], dtype=np.int32
+            )
+            dtype = np.dtype(np.int32)
+            chunks = (remap[values] for values in spilled(name, np.int32))
+            meta = {"kind": "category", "categories": categories[name]}
+        elif name == "Date":
+            dtype = np.dtype(np.int64)
+            chunks = spilled(name, dtype)
+            meta = {"kind": "datetime", "unit": "datetime64[ns]"}
+        elif name == "Invoice ID":
+            # Identifiants élargis à la largeur du plus long
+            dtype = np.dtype(f"S{max(text_widths, default=1)}")
+            chunks = spilled(name)
+            meta = {"kind": "bytes"}
+        else:
+            dtype = np.dtype(np.float64)
+            chunks = spilled(name, dtype)
+            meta = {"kind": "numeric"}
+        meta.update(file=f"{generation}-{index}.bin", dtype=dtype.str)
+        write_sorted(meta["file"], dtype, chunks)
+        os.remove(os.path.join(directory, f"{generation}-{name}.spill"))
+        columns[name] = meta
+    os.remove(os.path.join(directory, f"{generation}-positions.spill"))
+
+    # Cubes partiels regroupés sur les catégories finales
+    merged = pd.concat(partial_cubes, ignore_index=True)
+    for name in ("City", "Gender"):
+        merged[name] = pd.Categorical(
+            merged[name].astype(object), categories=categories[name]
+        )
+    merged_cube = (
+        merged.groupby(CUBE_KEYS, observed=True, sort=True)
+        .sum()
+        .reset_index()
+        .astype({"Invoices": "int64", "DistinctInvoices": "int64"})
+    )
+    cube_file = os.path.basename(snapshot_paths(f"{generation}-cube")[0])
+    write_snapshot(merged_cube, os.path.join(directory, cube_file))
+
+    appearance_order = {
+        name: [str(value) for value in codes[name]] for name in CATEGORICAL_COLUMNS
+    }
+    write_json(
+        dict(
+            source_stamp(path, stat),
+            version=STREAM_VERSION,
+            rows=rows,
+            columns=columns,
+            cube=cube_file,
+            order=appearance_order,
+        ),
+        os.path.join(directory, "manifest.json"),
+    )
+    for file in os.listdir(directory):
+        if file not in ("manifest.json", "lock") and not file.startswith(
+            f"{generation}-"
+        ):
+            os.remove(os.path.join(directory, file))
+
+
+# =======================
+# Jeux de données
+# =======================
+
+# Dossier de jeux de données supplémentaires : chaque fichier <nom>.csv y
+# est un jeu de données sélectionnable, chargé à sa première demande
+DATASETS_DIR = os.environ.get("DASHBOARD_DATASETS_DIR", "")
+# Mémoire (Mo) des jeux de données gardés chargés : les moins récemment
+# utilisés sont libérés au-delà (0 : sans limite)
+DATASET_BUDGET_MB = float(os.environ.get("DASHBOARD_DATASET_BUDGET_MB", "0"))
+
+# Jeu de données de DATA_PATH, nommé d'après son fichier
+DEFAULT_DATASET = os.path.splitext(os.path.basename(DATA_PATH))[0]
+
+# Jeux de données chargés, du moins au plus récemment utilisé
+DATASETS = OrderedDict()
+DATASETS_LOCK = threading.Lock()
+# Un verrou par jeu de données : un seul chargement à la fois
+LOADING_LOCKS = {}
+# Jeux de données déjà libérés une fois (leurs chargements sont des rechargements)
+EVICTED = set()
+# Versions des données (clé des caches), uniques d'un jeu de données à l'autre
+VERSIONS = itertools.count(1)
+# Threads qui ne chargent ni ne rafraîchissent de jeu de données (préchauffage)
+NO_LOAD = threading.local()
+
+
+class Dataset:
+    """Sales of one CSV file and everything derived from them.
+
+    With the SQLite backend, ``df``, ``cube`` and ``bitmap_index`` are
+    ``None`` and ``database`` is the path of the database.
+    """
+
+    def __init__(self, name, path):
+        self.name = name
+        self.path = path
+        self.mtime = os.stat(path).st_mtime_ns
+        self.df = self.cube = self.bitmap_index = self.database = None
+        # Colonnes projetées depuis SHARED_DIR (communes aux workers)
+        self.shared = False
+        # Colonnes de texte projetées hors de df (lues par les exports)
+        self.text_columns = {}
+        # Pris pendant les ajouts de ventes et la lecture de df et de son index
+        self.lock = threading.RLock()
+        # État du suivi des nouvelles ventes (cf. follow)
+        self.live = {}
+        # Taille du CSV lue au chargement et mémoire occupée
+        self.size = self.nbytes = 0
+
+
+def dataset_paths():
+    """CSV file of each dataset, by name: ``DATA_PATH`` then ``DATASETS_DIR``."""
+    paths = {DEFAULT_DATASET: DATA_PATH}
+    if DATASETS_DIR:
+        for file in sorted(os.listdir(DATASETS_DIR)):
+            name, extension = os.path.splitext(file)
+            if extension == ".csv":
+                paths.setdefault(name, os.path.join(DATASETS_DIR, file))
+    return paths
+
+
+def dataset_name(name):
+    """``name`` if it names a dataset, else ``DEFAULT_DATASET``."""
+    if name and (name in DATASETS or name in dataset_paths()):
+        return name
+    return DEFAULT_DATASET
+
+
+def dataset_bytes(dataset):
+    """Memory of ``df``, the cube and the bitmap index, as counted by pandas.
+
+    Once live appends have moved the columns and bitsets into buffers (cf.
+    ``extend_dataset``), their whole capacity is counted, with the strings
+    added up append by append: no scan of the rows.
+    """
+    if dataset.df is None:
+        return 0
+    live = dataset.live
+    if live.get("buffers"):
+        rows_bytes = live["text_bytes"] + sum(
+            values.nbytes for values, _ in live["buffers"].values()
+        )
+        bitmap_index = live["bitsets"]
+    else:
+        rows_bytes = dataset.df.memory_usage(deep=True).sum()
+        bitmap_index = dataset.bitmap_index
+    return int(
+        rows_bytes
+        + dataset.cube.memory_usage(deep=True).sum()
+        + sum(
+            bits.nbytes
+            for bitsets in bitmap_index.values()
+            for bits in bitsets.values()
+        )
+    )
+
+
+def text_bytes(values):
+    """Memory of the strings of the object array ``values``."""
+    return int(
+        pd.Series(values, copy=False).memory_usage(index=False, deep=True)
+        - values.nbytes
+    )
+
+
+def load_dataset(name, path):
+    """Load the sales of ``path`` as the dataset ``name``, with cube and index."""
+    dataset = Dataset(name, path)
+    # Taille mesurée avant la lecture : les ventes ajoutées pendant le
+    # chargement sont lues ensuite par read_new_sales. Quand les fichiers
+    # sont suivis, la lecture s'arrête à la dernière ligne complète (une
+    # ligne en cours d'écriture sera lue une fois terminée).
+    stat = os.stat(path)
+    size = complete_size(path, stat.st_size) if LIVE_SECONDS else stat.st_size
+    if size < stat.st_size:
+        logger.info(
+            "%s : dernière ligne sans fin de ligne, lue une fois terminée", path
+        )
+    if BACKEND == "sqlite":
+        # Rien n'est gardé en mémoire : les filtres partent en SQL
+        dataset.database, meta = open_database(path)
+        order = meta["order"]
+        first, last = meta["dates"]
+        rows = meta["rows"]
+    else:
+        if SHARED_DIR and name == DEFAULT_DATASET:
+            dataset.df, dataset.cube, dataset.text_columns = attach_shared(SHARED_DIR)
+            dataset.shared = True
+        elif streams(path):
+            dataset.df, dataset.cube, dataset.text_columns = stream_sales(
+                path, spill_dir(path)
+            )
+        else:
+            dataset.df = read_sales(path, stat, size)
+            dataset.cube = build_cube(dataset.df)
+        df = dataset.df
+        dataset.bitmap_index = build_bitmap_index(df, FILTER_DIMENSIONS)
+        order = df.attrs["order"]
+        # df est trié par date : première et dernière journée
+        first, last = (
+            (df["Date"].iloc[0], df["Date"].iloc[-1]) if len(df) else (None,) * 2
+        )
+        rows = len(df)
+    dataset.size = size
+    dataset.nbytes = dataset_bytes(dataset)
+    refresh_dataset(dataset, order, first, last, rows)
+    logger.info(
+        "Jeu de données %s chargé : %d ventes, %.0f Mo",
+        name,
+        rows,
+        dataset.nbytes / 2**20,
+    )
+    return dataset
+
+
+def refresh_dataset(dataset, order, first, last, rows):
+    """Refresh the dimension values, date bounds, calendar and version of
+    ``dataset``.
+
+    ``order`` maps each column to its values in order of appearance,
+    ``first`` and ``last`` are the first and last dates (``None`` if empty).
+    """
+    dataset.dimension_values = {dim: order.get(dim, []) for dim in FILTER_DIMENSIONS}
+    dataset.cities = dataset.dimension_values["City"]
+    dataset.genders = dataset.dimension_values["Gender"]
+    if first is not None:
+        dataset.date_bounds = (
+            pd.Timestamp(first).normalize(),
+            pd.Timestamp(last).normalize(),
+        )
+        dataset.calendar = build_calendar(*dataset.date_bounds)
+    else:
+        dataset.date_bounds = (pd.Timestamp.min, pd.Timestamp.max)
+        dataset.calendar = build_calendar(None, None)
+    dataset.version = next(VERSIONS)
+    # Empreinte envoyée au navigateur : identique d'un worker à l'autre
+    dataset.stamp = f"{dataset.name}-{dataset.mtime}-{rows}"
+
+
+def loaded_dataset(name):
+    """The dataset ``name`` if loaded, marked as the most recently used.
+
+    The reads of the threads of ``NO_LOAD`` do not count as uses.
+    """
+    with DATASETS_LOCK:
+        dataset = DATASETS.get(name)
+        if dataset is not None and not getattr(NO_LOAD, "active", False):
+            DATASETS.move_to_end(name)
+        return dataset
+
+
+def get_dataset(name=DEFAULT_DATASET):
+    """The dataset ``name``, loaded on first use.
+
+    Raises ``KeyError`` if ``name`` is not in ``dataset_paths``, or is not
+    loaded and the current thread may not load it (cf. ``NO_LOAD``).
+    """
+    dataset = loaded_dataset(name)
+    if dataset is not None:
+        return dataset
+    if getattr(NO_LOAD, "active", False):
+        raise KeyError(name)
+    path = dataset_paths()[name]
+    with LOADING_LOCKS.setdefault(name, threading.Lock()):
+        # Chargé entre-temps par une autre requête ?
+        dataset = loaded_dataset(name)
+        if dataset is None:
+            dataset = load_dataset(name, path)
+            store_dataset(dataset)
+    return dataset
+
+
+def store_dataset(dataset):
+    """Add or replace ``dataset``, evict datasets over budget, then run
+    RELOAD_HOOKS."""
+    with DATASETS_LOCK:
+        DATASETS[dataset.name] = dataset
+        DATASETS.move_to_end(dataset.name)
+
+    labels = (("dataset", dataset.name),)
+    increment("dashboard_dataset_loads_total", labels)
+    if dataset.name in EVICTED:
+        increment("dashboard_dataset_reloads_total", labels)
+    set_gauge("dashboard_dataset_bytes", labels, dataset.nbytes)
+    evict_datasets()
+    for hook in RELOAD_HOOKS:
+        hook(dataset)
+
+
+def evict_datasets():
+    """Free the least recently used datasets until the loaded ones fit in
+    ``DATASET_BUDGET_MB``; the most recently used one is always kept."""
+    with DATASETS_LOCK:
+        evicted = []
+        budget = DATASET_BUDGET_MB * 1024 * 1024
+        while (
+            budget
+            and len(DATASETS) > 1
+            and sum(loaded.nbytes for loaded in DATASETS.values()) > budget
+        ):
+            evicted.append(DATASETS.popitem(last=False)[1])
+
+    for old in evicted:
+        EVICTED.add(old.name)
+        labels = (("dataset", old.name),)
+        increment("dashboard_dataset_evictions_total", labels)
+        set_gauge("dashboard_dataset_bytes", labels, None)
+        # Ses résultats en cache retiendraient ses ventes
+        for cached in CACHED_FUNCTIONS:
+            cached.discard(old.name)
+        logger.info("Jeu de données %s libéré (%.0f Mo)", old.name, old.nbytes / 2**20)
+
+
+# Le jeu de données par défaut est chargé au démarrage
+get_dataset()
+
+
+# =======================
+# Cache des résultats
+# =======================
+
+CACHE_SIZE = int(os.environ.get("DASHBOARD_CACHE_SIZE", "128"))
+
+
+def canonical_filter(selected, all_values):
+    """Normalize a dropdown value into a hashable cache key.
+
+    ``None``, ``[]`` and the list of every value share the key ``()``, any
+    selection containing ``"all"`` becomes ``("all",)`` and the other
+    selections are deduplicated and sorted.
+    """
+    if not selected:
+        return ()
+    if "all" in selected:
+        return ("all",)
+    values = tuple(sorted(set(selected)))
+    if len(all_values) > 1 and set(values) == set(all_values):
+        return ()
+    return values
+
+
+def parse_day(value):
+    """Day of the date ``value`` (URL, ``/export``), ``None`` if missing or
+    unreadable: an invalid bound leaves the range open.
+
+    A time zone is dropped: the day is the one written in ``value``, as in
+    the export links (the dates of the sales have no time zone).
+    """
+    if not value:
+        return None
+    try:
+        day = pd.Timestamp(value)
+    except (TypeError, ValueError):
+        return None
+    if pd.isna(day):
+        return None
+    if day.tzinfo is not None:
+        day = day.tz_localize(None)
+    return day.normalize()
+
+
+def canonical_dates(dataset, start_date, end_date):
+    """Normalize a date range into a cache key.
+
+    Unreadable bounds are ignored and inverted bounds swapped. The range is
+    then clipped to ``dataset``; ``()`` stands for the whole history,
+    otherwise the key holds the first and last days as ISO strings (the
+    first after the last when the range lies outside the data).
+    """
+    first, last = dataset.date_bounds
+    start, end = parse_day(start_date), parse_day(end_date)
+    if start is not None and end is not None and start > end:
+        start, end = end, start
+    start = first if start is None else max(start, first)
+    end = last if end is None else min(end, last)
+    if start <= first and end >= last:
+        return ()
+    return (start.date().isoformat(), end.date().isoformat())
+
+
+def canonical_selections(dataset, selections):
+    """Canonical key of the dropdown values ``{dimension: selected}``.
+
+    Only the dimensions that restrict or split the data appear in the key,
+    in the order of ``DIMENSIONS``: untouched dropdowns cost nothing. For
+    a dimension that does not drive the display, "all" is no restriction.
+    """
+    key = []
+    for dim in FILTER_DIMENSIONS:
+        values = canonical_filter(selections.get(dim), dataset.dimension_values[dim])
+        if values == ("all",) and dim not in DISPLAY_DIMENSIONS:
+            values = ()
+        if values:
+            key.append((dim, values))
+    return tuple(key)
+
+
+# Fonctions mémoïsées, vidées à chaque rechargement des données
+CACHED_FUNCTIONS = []
+
+
+def memoize(func):
+    """LRU cache of ``CACHE_SIZE`` entries, shared by every dataset.
+
+    The first argument of ``func`` is a dataset name. Entries are keyed on
+    the version of that dataset too: a result computed while new sales
+    were being added is never served for the new data. ``discard`` drops
+    the entries of one dataset only.
+    """
+    entries = OrderedDict()
+    lock = threading.Lock()
+    stats = {"hits": 0, "misses": 0}
+
+    @wraps(func)
+    def cached(name, *args):
+        key = (name, get_dataset(name).version, *args)
+        with lock:
+            if key in entries:
+                entries.move_to_end(key)
+                stats["hits"] += 1
+                return entries[key]
+            stats["misses"] += 1
+        result = func(name, *args)
+        with lock:
+            entries[key] = result
+            while len(entries) > CACHE_SIZE:
+                entries.popitem(last=False)
+        return result
+
+    def discard(name, keep=None):
+        """Drop the entries of dataset ``name``, except those of version ``keep``."""
+        with lock:
+            for key in [key for key in entries if key[0] == name and key[1] != keep]:
+                del entries[key]
+
+    def cache_clear():
+        with lock:
+            entries.clear()
+
+    def cache_info():
+        with lock:
+            return dict(stats, size=len(entries), maxsize=CACHE_SIZE)
+
+    cached.discard = discard
+    cached.cache_clear = cache_clear
+    cached.cache_info = cache_info
+    CACHED_FUNCTIONS.append(cached)
+    return cached
+
+
+def discard_results(dataset):
+    """Drop the cached results of the previous versions of ``dataset``.
+
+    They keep views on the replaced sales: dropped at once rather than
+    left to age out of the LRU, so the old sales are freed. The results
+    of the other datasets stay cached.
+    """
+    for cached in CACHED_FUNCTIONS:
+        cached.discard(dataset.name, dataset.version)
+
+
+RELOAD_HOOKS.append(discard_results)
+
+
+def cache_stats():
+    """Hits, misses and size of every result cache."""
+    return {cached.__name__: cached.cache_info() for cached in CACHED_FUNCTIONS}
 
 
 # ============================
@@ -22,6 +1442,98 @@ server = app.server  # test
 app.title = "Tableau de bord des ventes"
 
 
+@server.route("/metrics")
+def metrics():
+    # Statistiques des caches, toujours disponibles
+    for name, stats in cache_stats().items():
+        with METRICS_LOCK:
+            for key in ("hits", "misses"):
+                COUNTERS.setdefault(f"dashboard_cache_{key}_total", {})[
+                    (("cache", name),)
+                ] = stats[key]
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
+
+if METRICS_ENABLED or SLOW_CALLBACK_MS:
+
+    @server.before_request
+    def start_request_timer():
+        g.request_start = time.perf_counter()
+
+    @server.after_request
+    def record_request(response):
+        if not request.path.endswith("_dash-update-component"):
+            return response
+        elapsed = time.perf_counter() - g.request_start
+        body = request.get_json(silent=True) or {}
+        output = body.get("output", "")
+        if METRICS_ENABLED:
+            labels = (("output", output),)
+            increment("dashboard_callbacks_total", labels)
+            observe("dashboard_callback_seconds", labels, elapsed)
+            if not response.direct_passthrough:
+                observe(
+                    "dashboard_response_bytes",
+                    labels,
+                    response.calculate_content_length() or 0,
+                    BYTES_BUCKETS,
+                )
+        if SLOW_CALLBACK_MS and elapsed * 1000 >= SLOW_CALLBACK_MS:
+            logger.warning(
+                "Callback lent (%.0f ms) pour %s, entrées : %s",
+                elapsed * 1000,
+                output,
+                json.dumps(body.get("inputs", []), default=str),
+            )
+        return response
+
+
+# Compression des réponses JSON de Dash (callbacks, mise en page) : brotli
+# quand il est installé et accepté par le navigateur, sinon gzip. Les
+# figures, très répétitives, y perdent 80 à 90 % de leur taille.
+COMPRESS_RESPONSES = os.environ.get("DASHBOARD_COMPRESS", "1") != "0"
+COMPRESS_MIN_BYTES = int(os.environ.get("DASHBOARD_COMPRESS_MIN_BYTES", "1000"))
+RESPONSE_ENCODINGS = (["br"] if brotli is not None else []) + ["gzip"]
+
+
+@timed("compress_response")
+def compress_body(data, encoding):
+    """``data`` compressed with ``encoding`` (``"br"`` or ``"gzip"``), at
+    levels fast enough for each response."""
+    if encoding == "br":
+        return brotli.compress(data, quality=4)
+    return gzip.compress(data, compresslevel=6)
+
+
+if COMPRESS_RESPONSES:
+
+    # Enregistré après record_request, donc exécuté avant lui : les tailles
+    # mesurées sont celles envoyées
+    @server.after_request
+    def compress_response(response):
+        if (
+            response.mimetype != "application/json"
+            or response.direct_passthrough
+            or response.is_streamed
+            or response.content_encoding
+        ):
+            return response
+        response.vary.add("Accept-Encoding")
+        encoding = request.accept_encodings.best_match(RESPONSE_ENCODINGS)
+        data = response.get_data()
+        if encoding is None or len(data) < COMPRESS_MIN_BYTES:
+            return response
+        response.set_data(compress_body(data, encoding))
+        response.content_encoding = encoding
+        return response
+
+
+# Formats d'export : type MIME et extension (Parquet seulement avec pyarrow)
+EXPORT_FORMATS = {"csv": ("text/csv", "csv")}
+if pq is not None:
+    EXPORT_FORMATS["parquet"] = ("application/vnd.apache.parquet", "parquet")
+
+
 # =======================
 # Définition des couleurs
 # =======================
@@ -33,11 +1545,33 @@ COLOR_TEXT = "#ecf0f1"
 COLOR_ACCENT = "#1abc9c"
 COLOR_GRAPH = "#e67e22"
 
+GENDER_COLOR_MAP = {
+    "Female": "#1abc9c",  # Vert
+    "Male": "#3498db",  # Bleu
+    "All": "#f1c40f",  # Jaune
+}
+
+CITY_COLOR_MAP = {
+    "Yangon": "#27ae60",  # Vert bien visible
+    "Naypyitaw": "#2980b9",  # Bleu foncé
+    "Mandalay": "#5dade2",  # Bleu clair, mais pas trop
+    "Moyenne des villes sélectionnées": "#f1c40f",  # Jaune doré pour bien ressortir
+    "Somme des 3 villes": "#000000",  # Noir pour un contraste maximal
+}
+
 
 # ============================
 # Mise en page de l'application
 # ============================
 
+
+def dimension_options(dataset, dim):
+    """Options of the dropdown of ``dim`` for ``dataset``."""
+    return [{"label": "Tout sélectionner", "value": "all"}] + [
+        {"label": value, "value": value} for value in dataset.dimension_values[dim]
+    ]
+
+
 app.layout = html.Div(
     [
         # En-tête et filtres alignés horizontalement
@@ -52,36 +1586,83 @@ app.layout = html.Div(
                         "fontSize": "34px",
                     },
                 ),
+                # Jeu de données (vide : celui par défaut), si plusieurs
                 html.Div(
                     [
                         dcc.Dropdown(
-                            id="city-filter",
-                            options=[{"label": "Tout sélectionner", "value": "all"}]
-                            + [
-                                {"label": city, "value": city}
-                                for city in df["City"].unique()
-                            ],
-                            placeholder="Sélectionner la ville",
-                            multi=True,
+                            id="dataset",
+                            options=list(dataset_paths()),
+                            placeholder=DEFAULT_DATASET,
                         )
                     ],
-                    style={"width": "30%", "display": "inline-block", "padding": "5px"},
+                    style={
+                        "width": "200px",
+                        "padding": "5px",
+                        "display": "block" if len(dataset_paths()) > 1 else "none",
+                    },
                 ),
+                # Une liste déroulante par dimension de DIMENSIONS
                 html.Div(
                     [
-                        dcc.Dropdown(
-                            id="gender-filter",
-                            options=[{"label": "Tout sélectionner", "value": "all"}]
-                            + [
-                                {"label": gender, "value": gender}
-                                for gender in df["Gender"].unique()
+                        html.Div(
+                            [
+                                dcc.Dropdown(
+                                    id={
+                                        "type": "dimension-filter",
+                                        "dimension": dim["column"],
+                                    },
+                                    options=dimension_options(
+                                        get_dataset(), dim["column"]
+                                    ),
+                                    placeholder=dim["placeholder"],
+                                    multi=True,
+                                )
                             ],
-                            placeholder="Sélectionner le genre",
-                            multi=True,
+                            style={"width": "30%", "padding": "5px"},
+                        )
+                        for dim in DIMENSIONS
+                    ],
+                    style={"display": "flex", "flexWrap": "wrap", "flex": "1"},
+                ),
+                html.Div(
+                    [
+                        dcc.DatePickerRange(
+                            id="date-filter",
+                            min_date_allowed=get_dataset().date_bounds[0].date(),
+                            max_date_allowed=get_dataset().date_bounds[1].date(),
+                            initial_visible_month=get_dataset().date_bounds[1].date(),
+                            display_format="DD/MM/YYYY",
+                            start_date_placeholder_text="Début",
+                            end_date_placeholder_text="Fin",
+                            clearable=True,
                         )
                     ],
-                    style={"width": "30%", "display": "inline-block", "padding": "5px"},
+                    style={"display": "inline-block", "padding": "5px"},
                 ),
+                # Liens d'export des ventes filtrées (cf. /export)
+                html.Div(
+                    [
+                        html.A(
+                            f"Exporter ({fmt.upper()})",
+                            id={"type": "export-link", "format": fmt},
+                            href=f"/export?format={fmt}",
+                            download="",
+                            style={"color": COLOR_ACCENT, "margin": "0 5px"},
+                        )
+                        for fmt in EXPORT_FORMATS
+                    ],
+                    style={"display": "inline-block", "padding": "5px"},
+                ),
+                dcc.Store(id="filter-state"),
+                # Nouvelles ventes : version des données vérifiée à chaque tic
+                dcc.Interval(
+                    id="live-interval",
+                    interval=max(LIVE_SECONDS, 1) * 1000,
+                    disabled=not LIVE_SECONDS,
+                ),
+                dcc.Store(id="data-version", data=get_dataset().stamp),
+                # Période lisible dans l'URL : ?start=2019-01-01&end=2019-01-31
+                dcc.Location(id="url", refresh=False),
                 html.Span(
                     "?",
                     title="Projet de Python-Dash / M1 ECAP 2024-2025 / DAËRON Djayan / Enseignant :  SANE Abdoul Razac",
@@ -176,7 +1757,10 @@ app.layout = html.Div(
         html.Div(
             [
                 html.Div(
-                    [dcc.Graph(id="hist-total-sales")],
+                    [
+                        dcc.Graph(id="hist-total-sales"),
+                        dcc.Store(id="hist-total-sales-signature"),
+                    ],
                     style={
                         "width": "48%",
                         "display": "inline-block",
@@ -187,7 +1771,10 @@ app.layout = html.Div(
                     },
                 ),
                 html.Div(
-                    [dcc.Graph(id="bar-total-invoices")],
+                    [
+                        dcc.Graph(id="bar-total-invoices"),
+                        dcc.Store(id="bar-total-invoices-signature"),
+                    ],
                     style={
                         "width": "48%",
                         "display": "inline-block",
@@ -205,7 +1792,24 @@ app.layout = html.Div(
             },
         ),
         html.Div(
-            [dcc.Graph(id="line-month-sales", style={"width": "100%"})],
+            [
+                # Résolution de la courbe : seule celle-ci est recalculée
+                dcc.RadioItems(
+                    id="resolution",
+                    options=[
+                        {"label": spec["label"], "value": resolution}
+                        for resolution, spec in RESOLUTIONS.items()
+                    ],
+                    value=DEFAULT_RESOLUTION,
+                    inline=True,
+                    inputStyle={"marginRight": "5px"},
+                    labelStyle={"marginRight": "15px", "color": COLOR_TEXT},
+                ),
+                dcc.Graph(id="line-month-sales", style={"width": "100%"}),
+                dcc.Store(id="line-month-sales-signature"),
+                # Largeur du graphique et zoom : points demandés au serveur
+                dcc.Store(id="line-view"),
+            ],
             style={
                 "width": "98%",
                 "padding": "10px",
@@ -213,336 +1817,1913 @@ app.layout = html.Div(
                 "backgroundColor": COLOR_CARD,
                 "margin": "20px auto",
                 "display": "flex",
-                "justifyContent": "center",
+                "flexDirection": "column",
+                "alignItems": "center",
             },
         ),
     ],
-    style={"backgroundColor": "#1e3a5f", "minHeight": "100vh", "padding": "0px"},
+    style={"backgroundColor": "#1e3a5f", "minHeight": "100vh", "padding": "0px"},
+)
+
+
+# ============================
+# Squelettes des figures
+# ============================
+# Les figures sont assemblées en dictionnaires à partir de mises en page
+# construites (et validées par plotly) une seule fois : chaque appel n'y
+# ajoute que le titre et les traces, sans passer par plotly.express.
+
+# Types numpy envoyés en tableaux typés (base64), comme le fait plotly
+TYPED_ARRAY_DTYPES = {
+    "int8": "i1",
+    "uint8": "u1",
+    "int16": "i2",
+    "uint16": "u2",
+    "int32": "i4",
+    "uint32": "u4",
+    "float32": "f4",
+    "float64": "f8",
+}
+FIGURE_LABELS = {
+    "City": "Ville",
+    "Gender": "Genre",
+    "Invoice ID": "Nombre d'achats (factures)",
+    "Total": "Montant total des achats (USD)",
+}
+# Parties du thème plotly envoyées avec chaque figure : les styles des
+# autres types de traces et des sous-graphiques absents (polaires, 3D,
+# cartes, échelles continues) ne servent à rien et pèsent 5 Ko par figure
+TEMPLATE_TRACE_TYPES = {"bar", "scatter", "scattergl"}
+UNUSED_TEMPLATE_LAYOUT = {"coloraxis", "colorscale", "geo", "polar", "scene", "ternary"}
+
+
+def figure_layout(**layout):
+    """Validated layout of an empty figure, with the parts of the plotly
+    template that style the dashboard's traces."""
+    layout = go.Figure(layout=layout).to_plotly_json()["layout"]
+    template = layout["template"]
+    template["data"] = {
+        trace_type: styles
+        for trace_type, styles in template["data"].items()
+        if trace_type in TEMPLATE_TRACE_TYPES
+    }
+    template["layout"] = {
+        key: value
+        for key, value in template["layout"].items()
+        if key not in UNUSED_TEMPLATE_LAYOUT
+    }
+    return layout
+
+
+def px_axes(x, y):
+    """Axes of a single-panel plotly.express figure."""
+    return {
+        "xaxis": {"anchor": "y", "domain": [0.0, 1.0], "title_text": x},
+        "yaxis": {"anchor": "x", "domain": [0.0, 1.0], "title_text": y},
+    }
+
+
+BAR_LAYOUT = figure_layout(
+    **px_axes(FIGURE_LABELS["City"], FIGURE_LABELS["Invoice ID"]),
+    legend={"tracegroupgap": 0, "traceorder": "reversed"},
+    barmode="stack",
+)
+
+
+def line_layout(resolution):
+    axes = px_axes(RESOLUTIONS[resolution]["axis"], FIGURE_LABELS["Total"])
+    # Axe des dates : les périodes sont placées à leur premier jour
+    axes["xaxis"].update(type="date", hoverformat=RESOLUTIONS[resolution]["format"])
+    return figure_layout(**axes, legend={"tracegroupgap": 0})
+
+
+LINE_LAYOUTS = {resolution: line_layout(resolution) for resolution in RESOLUTIONS}
+# Palette du thème, pour les valeurs absentes des correspondances de couleurs
+COLORWAY = BAR_LAYOUT["template"]["layout"]["colorway"]
+
+BAR_TRACE = {
+    "orientation": "v",
+    "showlegend": True,
+    "textposition": "auto",
+    "xaxis": "x",
+    "yaxis": "y",
+    "type": "bar",
+}
+LINE_TRACE = {
+    "marker": {"symbol": "circle"},
+    "mode": "lines",
+    "orientation": "v",
+    "showlegend": True,
+    "xaxis": "x",
+    "yaxis": "y",
+    "type": "scatter",
+}
+# Traces WebGL : mêmes propriétés, sauf l'orientation que scattergl n'a pas
+LINE_GL_TRACE = dict(
+    {key: value for key, value in LINE_TRACE.items() if key != "orientation"},
+    type="scattergl",
+)
+# Points de la courbe au-delà desquels elle est dessinée en WebGL (comme
+# render_mode="auto" de plotly.express)
+WEBGL_POINTS = int(os.environ.get("DASHBOARD_WEBGL_POINTS", "1000"))
+
+
+def typed_array(values):
+    """``values`` as plotly serializes them: numeric arrays as base64 typed
+    arrays (64-bit integers narrowed when they fit), dates as ISO strings
+    and the rest as lists."""
+    values = np.asarray(values)
+    if values.dtype.kind == "M":
+        return np.datetime_as_string(values).tolist()
+    if values.size and values.dtype.name in ("int64", "uint64"):
+        low, high = values.min(), values.max()
+        for dtype in ("8", "16", "32"):
+            dtype = values.dtype.name[:-2] + dtype
+            info = np.iinfo(dtype)
+            if info.min <= low and high <= info.max:
+                values = values.astype(dtype)
+                break
+    if not values.size or values.dtype.name not in TYPED_ARRAY_DTYPES:
+        return values.tolist()
+    array = {
+        "dtype": TYPED_ARRAY_DTYPES[values.dtype.name],
+        "bdata": base64.b64encode(np.ascontiguousarray(values)).decode("ascii"),
+    }
+    if values.ndim > 1:
+        array["shape"] = str(values.shape)[1:-1]
+    return array
+
+
+def discrete_colors(values, color_map):
+    """Colors of ``values`` as plotly.express assigns them: from
+    ``color_map``, then from the theme palette for the unknown ones."""
+    color_map = dict(color_map)
+    for value in values:
+        if value not in color_map:
+            color_map[value] = COLORWAY[len(color_map) % len(COLORWAY)]
+    return [color_map[value] for value in values]
+
+
+def with_title(layout, title, legend_title=None):
+    """Copy of a skeleton ``layout`` with its titles; the nested skeleton
+    parts are shared, not copied."""
+    layout = dict(layout, title={"text": title})
+    if legend_title is not None:
+        layout["legend"] = dict(layout["legend"], title={"text": legend_title})
+    return layout
+
+
+def build_bar(counts, color_var, title):
+    """Stacked bars of the invoice counts per city, as ``px.bar`` would
+    draw them with ``color=color_var`` (no color if None)."""
+    layout = with_title(BAR_LAYOUT, title)
+    if color_var is None:
+        hover = "Ville=%{x}<br>Nombre d'achats (factures)=%{y}<extra></extra>"
+        trace = dict(
+            BAR_TRACE,
+            hovertemplate=hover,
+            legendgroup="",
+            marker={"color": COLORWAY[0], "pattern": {"shape": ""}},
+            name="",
+            showlegend=False,
+            x=typed_array(counts["City"]),
+            y=typed_array(counts["Invoice ID"]),
+        )
+        return {"data": [trace], "layout": layout}
+
+    groups = list(counts.groupby(color_var, sort=False, observed=True))
+    names = [name for name, _ in groups]
+    if color_var == "City":
+        # Les villes restent dans l'ordre des données sur l'axe
+        layout["xaxis"] = dict(
+            layout["xaxis"], categoryorder="array", categoryarray=names
+        )
+        color_map, prefix = CITY_COLOR_MAP, ""
+    else:
+        color_map, prefix = GENDER_COLOR_MAP, f"{FIGURE_LABELS[color_var]}=%s<br>"
+    if not names:
+        return {"data": [], "layout": layout}
+    layout = with_title(layout, title, FIGURE_LABELS[color_var])
+
+    traces = []
+    for (name, rows), color in zip(groups, discrete_colors(names, color_map)):
+        traces.append(
+            dict(
+                BAR_TRACE,
+                hovertemplate=(prefix % name if prefix else "")
+                + "Ville=%{x}<br>Nombre d'achats (factures)=%{y}<extra></extra>",
+                legendgroup=name,
+                marker={"color": color, "pattern": {"shape": ""}},
+                name=name,
+                x=typed_array(rows["City"]),
+                y=typed_array(rows["Invoice ID"]),
+            )
+        )
+    return {"data": traces, "layout": layout}
+
+
+def build_line(period_sales, resolution, title, window=()):
+    """Thick lines of the totals per period and city, as ``px.line`` would
+    draw them with ``color="City"``.
+
+    ``window`` is the zoomed range of the x axis (``()`` for the whole
+    period). Beyond ``WEBGL_POINTS`` points, the lines are drawn in WebGL.
+    """
+    layout = LINE_LAYOUTS[resolution]
+    if window:
+        layout = dict(layout, xaxis=dict(layout["xaxis"], range=list(window)))
+    groups = list(period_sales.groupby("City", sort=False, observed=True))
+    names = [name for name, _ in groups]
+    if not names:
+        return {"data": [], "layout": with_title(layout, title)}
+
+    axis = RESOLUTIONS[resolution]["axis"]
+    trace = LINE_GL_TRACE if len(period_sales) > WEBGL_POINTS else LINE_TRACE
+    traces = []
+    for (name, rows), color in zip(groups, discrete_colors(names, CITY_COLOR_MAP)):
+        traces.append(
+            dict(
+                trace,
+                hovertemplate=f"Ville={name}<br>{axis}=%{{x}}<br>"
+                "Montant total des achats (USD)=%{y}<extra></extra>",
+                legendgroup=name,
+                line={"color": color, "dash": "solid", "shape": "linear", "width": 5},
+                name=name,
+                x=typed_array(rows["Period"].to_numpy().astype("datetime64[D]")),
+                # Montants au centime : mieux compressés, et lisibles au survol
+                y=typed_array(rows["Total"].round(2)),
+            )
+        )
+    return {"data": traces, "layout": with_title(layout, title, "Ville")}
+
+
+# ============================
+# Sous-échantillonnage de la courbe
+# ============================
+
+# Colonnes de pixels de la courbe tant que la largeur du graphique est
+# inconnue, et bornes de celles annoncées par le navigateur
+LINE_BUCKETS = 1200
+MIN_LINE_BUCKETS, MAX_LINE_BUCKETS = 100, 4000
+
+
+def downsample(x, y, buckets, start=None, stop=None):
+    """Positions of the points of ``(x, y)`` drawn on ``buckets`` pixel columns.
+
+    ``x`` is sorted. Only the points from ``start`` to ``stop`` are kept,
+    with their nearest neighbour on each side so that the line reaches the
+    edges. Beyond two points per column, only the lowest and the highest
+    of each column remain, with the first and last points (min/max
+    decimation): the drawn shape is unchanged and the number of points
+    depends on the width only.
+    """
+    first = 0 if start is None else max(int(np.searchsorted(x, start)) - 1, 0)
+    end = len(x)
+    if stop is not None:
+        end = min(int(np.searchsorted(x, stop, side="right")) + 1, end)
+    positions = np.arange(first, end)
+    if len(positions) <= 2 * buckets:
+        return positions
+
+    visible = x[positions]
+    columns = (visible - visible[0]) * buckets // (visible[-1] - visible[0] + 1)
+    # Tri par colonne puis par valeur : le premier et le dernier point de
+    # chaque colonne en sont le minimum et le maximum
+    order = np.lexsort((y[positions], columns))
+    edges = np.flatnonzero(np.diff(columns[order])) + 1
+    kept = np.concatenate(
+        [order[np.r_[0, edges]], order[np.r_[edges - 1, -1]], [0, len(positions) - 1]]
+    )
+    return positions[np.unique(kept)]
+
+
+@timed("downsample_line")
+def visible_points(period_sales, window, buckets):
+    """Rows of ``period_sales`` drawn in ``window`` on ``buckets`` pixel
+    columns, city by city (cf. ``downsample``)."""
+    days = period_sales["Period"].to_numpy().astype("datetime64[D]").astype(np.int64)
+    totals = period_sales["Total"].to_numpy()
+    start, stop = (
+        [np.datetime64(bound[:10], "D").astype(np.int64) for bound in window]
+        if window
+        else (None, None)
+    )
+    groups = period_sales.groupby("City", sort=False).indices
+    positions = [
+        rows[downsample(days[rows], totals[rows], buckets, start, stop)]
+        for rows in (groups[name] for name in period_sales["City"].unique())
+    ]
+    if not positions:
+        return period_sales
+    return period_sales.iloc[np.concatenate(positions)]
+
+
+def line_view(view):
+    """Cache keys ``(window, buckets)`` of the ``line-view`` store.
+
+    ``window`` is the zoomed range of the x axis (``()`` when not zoomed)
+    and ``buckets`` the width of the graph in pixels.
+    """
+    view = view or {}
+    window = tuple(str(bound) for bound in view.get("range") or ())
+    try:
+        for bound in window:
+            np.datetime64(bound[:10], "D")
+    except ValueError:
+        window = ()
+    if len(window) != 2:
+        window = ()
+    try:
+        width = int(view.get("width") or LINE_BUCKETS)
+    except (TypeError, ValueError):
+        width = LINE_BUCKETS
+    return window, min(max(width, MIN_LINE_BUCKETS), MAX_LINE_BUCKETS)
+
+
+# ============================
+# Histogramme pré-agrégé
+# ============================
+
+PATTERN_SHAPES = ["", "/", "\\", "x", "-", "|", "+", "."]
+HIST_LAYOUT = figure_layout(
+    xaxis_title_text=FIGURE_LABELS["Total"],
+    yaxis_title_text=FIGURE_LABELS["Invoice ID"],
+    legend={"tracegroupgap": 0, "traceorder": "reversed"},
+    barmode="stack",
+    bargap=0,
+)
+# Au-delà, l'écart minimal entre valeurs distinctes est ignoré (pas de tri)
+DISTINCT_LIMIT = 100_000
+
+
+def nice_round(value, steps, reverse=False):
+    """Lib.roundUp of plotly.js: snap ``value`` onto the sorted ``steps``."""
+    if reverse:
+        candidates = [step for step in steps if step <= value]
+        return candidates[-1] if candidates else steps[0]
+    candidates = [step for step in steps if step > value]
+    return candidates[0] if candidates else steps[-1]
+
+
+def near_edge(values, start, size):
+    """Whether ``values`` fall within 2% of a bin edge."""
+    return (1 + (values - start) * 100 / size) % 100 < 2
+
+
+def histogram_bins(values):
+    """Bin start and size chosen like the plotly.js histogram autobinning."""
+    count = len(values)
+    return autobin(
+        count,
+        float(values.min()),
+        float(values.max()),
+        float(values.std()),
+        np.unique(values) if count <= DISTINCT_LIMIT else None,
+        bool(np.all(values % 1 == 0)),
+        lambda offset, start, size: int(near_edge(values + offset, start, size).sum()),
+    )
+
+
+def autobin(count, data_min, data_max, std, distinct, integers, edge_count):
+    """plotly.js autobinning from summary statistics of the values.
+
+    ``distinct`` holds the sorted distinct values, or ``None`` above
+    ``DISTINCT_LIMIT`` rows: the minimum spacing between them only matters
+    for small samples. ``edge_count(offset, start, size)`` counts the
+    values that, shifted by ``offset``, fall near a bin edge.
+    """
+    min_size = 0.0
+    if distinct is not None:
+        min_diff = np.diff(distinct).min() if len(distinct) > 1 else 0.0
+        if min_diff > 0:
+            exponent = 10 ** np.floor(np.log10(min_diff))
+            min_size = exponent * nice_round(
+                min_diff / exponent, [0.9, 1.9, 4.9, 9.9], reverse=True
+            )
+    size = max(min_size, 2 * std / count**0.4)
+    if not np.isfinite(size) or size <= 0:
+        size = 1.0
+
+    base = 10 ** np.floor(np.log10(size))
+    size = float(base * nice_round(size / base, [2, 5, 10]))
+    start = np.ceil(data_min / size) * size - size
+
+    # Décalage d'une demi-classe si trop de valeurs tombent sur les bornes
+    if integers:
+        if size < 1:
+            start = data_min - 0.5 * size
+        else:
+            start -= 0.5
+            if start + size < data_min:
+                start += size
+    elif edge_count(size / 2, start, size) < count * 0.1:
+        if (
+            edge_count(0, start, size) > count * 0.3
+            or near_edge(data_min, start, size)
+            or near_edge(data_max, start, size)
+        ):
+            shift = size / 2
+            start += shift if start + shift < data_min else -shift
+
+    nbins = int(np.floor((data_max - start) / size)) + 1
+    return start, size, nbins
+
+
+def group_codes(column, order):
+    """Codes of ``column`` following ``order``, restricted to present values."""
+    values = column.to_numpy()
+    observed = set(pd.unique(values))
+    present = [value for value in order if value in observed]
+    codes = pd.Index(present).get_indexer(values)
+    return codes, present
+
+
+def histogram_counts(data, color_var, pattern_var, orders):
+    """Bin ``Total`` and count the rows of every (color, pattern) group.
+
+    Groups follow the order of appearance of the values (``orders`` maps
+    each column to its values), as ``px.histogram`` would do. Returns
+    ``None`` when there is no row.
+    """
+    if data.empty:
+        return None
+
+    values = data["Total"].to_numpy(dtype=float)
+    start, size, nbins = histogram_bins(values)
+    bins = np.clip(((values - start) // size).astype(np.int64), 0, nbins - 1)
+
+    group_vars = [var for var in (color_var, pattern_var) if var]
+    group_values = []
+    codes = np.zeros(len(values), dtype=np.int64)
+    for var in group_vars:
+        var_codes, present = group_codes(data[var], orders[var])
+        codes = codes * len(present) + var_codes
+        group_values.append(present)
+
+    ngroups = int(np.prod([len(present) for present in group_values]))
+    counts = np.bincount(codes * nbins + bins, minlength=ngroups * nbins)
+    return {
+        "edges": start + size * np.arange(nbins + 1),
+        "size": size,
+        "group_vars": group_vars,
+        "group_values": group_values,
+        "counts": counts.reshape(ngroups, nbins),
+    }
+
+
+def sqlite_histogram_counts(name, restrictions, date_key, color_var, pattern_var):
+    """``histogram_counts`` computed by SQLite, without loading the rows."""
+    dataset = get_dataset(name)
+    database = dataset.database
+    stats = sqlite_backend.total_stats(database, restrictions, date_key, DISTINCT_LIMIT)
+    if not stats["count"]:
+        return None
+
+    def edge_count(offset, start, size):
+        return sqlite_backend.near_edge_count(
+            database, restrictions, date_key, offset, start, size
+        )
+
+    start, size, nbins = autobin(
+        stats["count"],
+        stats["min"],
+        stats["max"],
+        stats["std"],
+        stats["distinct"],
+        stats["integers"],
+        edge_count,
+    )
+    group_vars = [var for var in (color_var, pattern_var) if var]
+    rows = sqlite_backend.binned_counts(
+        database, restrictions, date_key, group_vars, start, size, nbins
+    )
+
+    # Groupes dans l'ordre d'apparition des valeurs, comme histogram_counts
+    group_values = []
+    for index, var in enumerate(group_vars):
+        observed = {row[index] for row in rows}
+        order = dataset.dimension_values[var]
+        group_values.append([value for value in order if value in observed])
+    counts = np.zeros(
+        (int(np.prod([len(present) for present in group_values])), nbins),
+        dtype=np.int64,
+    )
+    for *group, bin_index, count in rows:
+        code = 0
+        for value, present in zip(group, group_values):
+            code = code * len(present) + present.index(value)
+        counts[code, bin_index] = count
+    return {
+        "edges": start + size * np.arange(nbins + 1),
+        "size": size,
+        "group_vars": group_vars,
+        "group_values": group_values,
+        "counts": counts,
+    }
+
+
+def build_histogram(
+    hist,
+    color_var,
+    pattern_var,
+    title,
+    color_map,
+    pattern_color_map,
+    default_color,
+):
+    """Stacked bars drawn from the output of ``histogram_counts``.
+
+    The payload only holds one count per bin and per trace, whatever the
+    number of rows.
+    """
+    layout = with_title(HIST_LAYOUT, title)
+    if hist is None:
+        return {"data": [], "layout": layout}
+
+    edges, size = hist["edges"], hist["size"]
+    group_vars, group_values = hist["group_vars"], hist["group_values"]
+    counts = hist["counts"]
+
+    if group_vars:
+        layout = with_title(
+            layout, title, ", ".join(FIGURE_LABELS[var] for var in group_vars)
+        )
+    # Centres et bornes des classes, communs à toutes les traces
+    centers = typed_array((edges[:-1] + edges[1:]) / 2)
+    customdata = typed_array(np.column_stack([edges[:-1], edges[1:]]))
+    groups = pd.MultiIndex.from_product(group_values) if group_vars else [()]
+    traces = []
+    for group, group_counts in zip(groups, counts):
+        if not group_counts.any():
+            continue
+        group = group if isinstance(group, tuple) else (group,)
+        keys = dict(zip(group_vars, group))
+        marker = {}
+        if color_var:
+            marker["color"] = color_map.get(keys[color_var], "#000000")
+            if pattern_var:
+                shape_index = group_values[1].index(keys[pattern_var])
+                marker["pattern"] = dict(
+                    shape=PATTERN_SHAPES[shape_index % len(PATTERN_SHAPES)]
+                )
+        elif pattern_var:
+            marker["color"] = pattern_color_map.get(keys[pattern_var], "#000000")
+        else:
+            marker["color"] = default_color
+
+        hover = "".join(f"{FIGURE_LABELS[var]}={keys[var]}<br>" for var in group_vars)
+        traces.append(
+            {
+                "customdata": customdata,
+                "hovertemplate": hover
+                + f"{FIGURE_LABELS['Total']}=%{{customdata[0]}} - %{{customdata[1]}}"
+                + "<br>count=%{y}<extra></extra>",
+                "legendgroup": ", ".join(str(value) for value in group),
+                "marker": marker,
+                "name": ", ".join(str(value) for value in group),
+                "showlegend": bool(group_vars),
+                "width": size,
+                "x": centers,
+                "y": typed_array(group_counts),
+                "type": "bar",
+            }
+        )
+    return {"data": traces, "layout": layout}
+
+
+# ============================
+# Mises à jour partielles des figures
+# ============================
+
+# Propriétés de style envoyées par Patch quand seules elles changent
+STYLE_PATHS = [("marker", "color"), ("line", "color")]
+
+
+def with_signature(fig):
+    """Pair a figure with the signature used by ``figure_update``.
+
+    The data part hashes everything but the title and the trace colors,
+    the style part lists those, so a change of title or colors alone can
+    be sent as a ``Patch``.
+    """
+    styles = []
+    traces = []
+    for trace in fig["data"]:
+        trace = dict(trace)
+        trace_styles = []
+        for parent, key in STYLE_PATHS:
+            if parent in trace:
+                trace[parent] = dict(trace[parent])
+                trace_styles.append(trace[parent].pop(key, None))
+            else:
+                trace_styles.append(None)
+        styles.append(trace_styles)
+        traces.append(trace)
+    layout = dict(fig["layout"])
+    title = layout.pop("title", {}).get("text")
+    # Même sérialisation que Dash (orjson quand il est installé)
+    content = to_json_plotly([traces, layout])
+    signature = {
+        "data": hashlib.sha1(content.encode()).hexdigest(),
+        "style": {"title": title, "traces": styles},
+    }
+    return fig, signature
+
+
+def figure_update(fig, signature, previous):
+    """Full figure, ``Patch`` of the title/colors, or nothing at all."""
+    if previous == signature:
+        return no_update, no_update
+    if not previous or previous["data"] != signature["data"]:
+        return fig, signature
+
+    patch = Patch()
+    style, previous_style = signature["style"], previous["style"]
+    if style["title"] != previous_style["title"]:
+        patch["layout"]["title"]["text"] = style["title"]
+    for index, (colors, previous_colors) in enumerate(
+        zip(style["traces"], previous_style["traces"])
+    ):
+        for (parent, key), color, previous_color in zip(
+            STYLE_PATHS, colors, previous_colors
+        ):
+            if color != previous_color:
+                patch["data"][index][parent][key] = color
+    return patch, signature
+
+
+# ============================
+# Callbacks pour les mises à jour
+# ============================
+
+# Chaque indicateur et chaque graphique a son propre callback, déclenché
+# par le magasin ``filter-state`` (sélections normalisées dans le
+# navigateur) et par la version des données. Les étapes communes
+# (contexte d'affichage, cube filtré) sont mémoïsées et partagées.
+
+
+@memoize
+def filter_context(name, filter_key, date_key):
+    """Selections, display modes and titles shared by every output."""
+    dataset = get_dataset(name)
+    selections = dict(filter_key)
+    selected_cities = list(selections.get("City", ()))
+    selected_genders = list(selections.get("Gender", ()))
+
+    # Gestion des villes : si vide, on considère toutes les villes
+    if not selected_cities:
+        filtered_cities = dataset.cities
+        show_city_distinction = True
+    elif "all" in selected_cities:
+        filtered_cities = dataset.cities
+        show_city_distinction = False
+    else:
+        filtered_cities = selected_cities
+        show_city_distinction = True
+
+    # Gestion des genres : si vide, on considère tous les genres
+    if not selected_genders:
+        filtered_genders = dataset.genders
+        show_gender_distinction = True
+    elif "all" in selected_genders:
+        filtered_genders = dataset.genders
+        show_gender_distinction = False
+    else:
+        filtered_genders = selected_genders
+        show_gender_distinction = True
+
+    # Déterminer si on doit colorer par Genre ou Ville
+    color_var = None
+    pattern_var = None
+
+    if show_gender_distinction and show_city_distinction:
+        color_var = "Gender"
+        pattern_var = "City"
+    elif show_city_distinction:
+        pattern_var = "City"  # Toujours en pattern si distinction de ville
+        color_var = None  # Pas de couleur si uniquement distinction par ville
+    elif show_gender_distinction:
+        color_var = "Gender"
+        pattern_var = None  # Pas de pattern si uniquement distinction par genre
+
+    # Titres dynamiques
+    gender_translation = {"Male": "hommes", "Female": "femmes"}
+    gender_title = ""
+    if show_gender_distinction:
+        translated_genders = [gender_translation.get(g, g) for g in selected_genders]
+        if len(translated_genders) == 1:
+            gender_title = f" pour les {translated_genders[0]}"
+        else:
+            gender_title = " par genre"
+
+    city_title = ""
+    if show_city_distinction:
+        if len(selected_cities) == 1:
+            city_title = f" à {selected_cities[0]}"
+        else:
+            city_title = " par ville"
+
+    # Restrictions effectives, toutes dimensions confondues ("Tout
+    # sélectionner" ne restreint rien)
+    restrictions = tuple(
+        (dim, values) for dim, values in filter_key if values != ("all",)
+    )
+
+    return {
+        "selected_cities": selected_cities,
+        "selected_genders": selected_genders,
+        "filtered_cities": tuple(sorted(filtered_cities)),
+        "filtered_genders": tuple(sorted(filtered_genders)),
+        # Clé des données filtrées, partagée par tous les modes d'affichage
+        "data_key": (name, restrictions, date_key),
+        "show_city_distinction": show_city_distinction,
+        "show_gender_distinction": show_gender_distinction,
+        "color_var": color_var,
+        "pattern_var": pattern_var,
+        "gender_title": gender_title,
+        "city_title": city_title,
+    }
+
+
+@memoize
+def dimension_cube(name, extra_keys):
+    """Cube grouped by ``CUBE_KEYS`` plus the active ``extra_keys``.
+
+    Built once per combination of active dimensions, so filtering on a
+    dimension outside ``CUBE_KEYS`` stays a scan of aggregates.
+    """
+    dataset = get_dataset(name)
+    if not extra_keys:
+        return dataset.cube
+    return build_cube(dataset.df, extra_keys)
+
+
+@memoize
+@timed("filter")
+def filtered_data(name, restrictions, date_key):
+    """Cube rows matching ``restrictions`` and the dates.
+
+    ``restrictions`` holds ``(dimension, values)`` pairs. Keyed on the
+    selected values only, so every display mode over the same selection
+    shares the same intermediate. The cubes are sorted by date: the date
+    range is a binary-search slice.
+    """
+    dataset = get_dataset(name)
+    if dataset.database:
+        return sqlite_backend.query_cube(
+            dataset.database, restrictions, date_key, CUBE_KEYS
+        )
+
+    # Les indicateurs et les graphiques agrégés sont lus dans le cube des
+    # dimensions actives, construit à partir des ventes courantes
+    with dataset.lock:
+        restricted_cube = dimension_cube(
+            name, tuple(dim for dim, _ in restrictions if dim not in CUBE_KEYS)
+        )
+    cube_start, cube_stop = date_slice(restricted_cube["Date"], date_key)
+    filtered = restricted_cube.iloc[cube_start:cube_stop]
+    if restrictions:
+        mask = np.ones(len(filtered), dtype=bool)
+        for dim, values in restrictions:
+            mask &= filtered[dim].isin(values).to_numpy()
+        filtered = filtered[mask]
+    return filtered
+
+
+@timed("filter_rows")
+def filtered_rows(name, restrictions, date_key):
+    """Raw rows of ``df`` matching ``restrictions`` and the dates.
+
+    Only the histogram needs them, and only its counts are cached
+    (``hist_data``): a copy of the rows per selection would cost as much
+    memory as the data itself. The rows are picked with the bitmap index
+    and the date slice of ``df`` (no copy when everything is selected).
+    """
+    dataset = get_dataset(name)
+    # df et l'index bitmap doivent correspondre aux mêmes ventes
+    with dataset.lock:
+        df = dataset.df
+        start, stop = date_slice(df["Date"], date_key)
+        selection = select_rows(dataset, dict(restrictions))
+        if selection is None:
+            return df.iloc[start:stop]
+        return df.iloc[start:stop][selection_mask(selection, start, stop)]
+
+
+@memoize
+@timed("groupby_kpi")
+def kpi_texts(name, restrictions, date_key):
+    filtered_cube = filtered_data(name, restrictions, date_key)
+
+    # Calculs des indicateurs
+    total_sales = f"{filtered_cube['Total'].sum():,.2f}".replace(",", " ") + " USD"
+    total_invoices = f"{filtered_cube['DistinctInvoices'].sum():,.0f}".replace(",", " ")
+    return total_sales, total_invoices
+
+
+# Chaque graphique est produit en deux étapes : agrégation (``*_data``)
+# puis construction de la figure (``render_*``).
+
+
+@memoize
+@timed("histogram")
+def hist_data(name, filter_key, date_key):
+    context = filter_context(name, filter_key, date_key)
+    dataset = get_dataset(name)
+    if dataset.database:
+        return sqlite_histogram_counts(
+            *context["data_key"], context["color_var"], context["pattern_var"]
+        )
+    filtered_df = filtered_rows(*context["data_key"])
+    return histogram_counts(
+        filtered_df,
+        context["color_var"],
+        context["pattern_var"],
+        dataset.dimension_values,
+    )
+
+
+@timed("figure_hist")
+def render_hist(context, hist):
+    # Histogramme pré-calculé côté serveur : couleurs selon le genre et
+    # motifs selon la ville, ou couleur unique si "Tout sélectionner"
+    return build_histogram(
+        hist,
+        color_var=context["color_var"],
+        pattern_var=context["pattern_var"],
+        title="Répartition des montants totaux des achats"
+        f"{context['gender_title']}{context['city_title']}",
+        color_map=GENDER_COLOR_MAP,
+        pattern_color_map=CITY_COLOR_MAP,
+        default_color=CITY_COLOR_MAP["Moyenne des villes sélectionnées"],
+    )
+
+
+@memoize
+@timed("groupby_bar")
+def bar_data(name, filter_key, date_key):
+    context = filter_context(name, filter_key, date_key)
+    filtered_cube = filtered_data(*context["data_key"])
+    # Empilement par genre dès que le genre est distingué
+    if "all" not in context["selected_genders"] and context["show_gender_distinction"]:
+        return count_invoices(filtered_cube, ["City", "Gender"])
+    return count_invoices(filtered_cube, ["City"])
+
+
+@timed("figure_bar")
+def render_bar(context, bar_counts):
+    selected_genders = context["selected_genders"]
+    show_city_distinction = context["show_city_distinction"]
+    show_gender_distinction = context["show_gender_distinction"]
+    gender_title = context["gender_title"]
+    city_title = context["city_title"]
+
+    # Barre des achats totaux (Empilement : Sexe → Ville), colorée par
+    # ville si "Tout sélectionner" est activé pour le genre
+    if "all" in selected_genders:
+        color_var = "City"
+        title = f"Nombre total d'achats (factures) {city_title}"
+    elif show_city_distinction and show_gender_distinction:
+        color_var = "Gender"
+        title = f"Nombre total d'achats (factures){gender_title}{city_title}"
+    elif show_city_distinction:
+        color_var = "City"
+        title = f"Nombre total d'achats (factures) {city_title}"
+    elif show_gender_distinction:
+        color_var = "Gender"
+        title = f"Nombre total d'achats (factures){gender_title}"
+    else:
+        color_var = None
+        title = "Nombre total d'achats (factures)"
+
+    # Légende inversée (BAR_LAYOUT) : "Male" en bas et "Female" en haut
+    return build_bar(bar_counts, color_var, title)
+
+
+@memoize
+@timed("groupby_line")
+def line_data(name, filter_key, date_key, resolution):
+    context = filter_context(name, filter_key, date_key)
+    filtered_cube = filtered_data(*context["data_key"])
+    selected_cities = context["selected_cities"]
+    filtered_cities = context["filtered_cities"]
+
+    # Sommes par période et par ville, sur les codes entiers du calendrier
+    starts, cities, totals, present = rollup(
+        filtered_cube, get_dataset(name).calendar, resolution
+    )
+    periods, city_index = np.nonzero(present)
+    period_sales = pd.DataFrame(
+        {
+            "Period": starts[periods],
+            "City": cities[city_index],
+            "Total": totals[present],
+        }
+    )
+    observed = present.any(axis=1)
+
+    # Vérifier si "Tout sélectionner" est activé
+    if "all" in selected_cities:
+        # Afficher uniquement la somme des 3 villes
+        period_sales = pd.DataFrame(
+            {
+                "Period": starts[observed],
+                "City": "Somme des 3 villes",
+                "Total": totals.sum(axis=1)[observed],
+            }
+        )
+    elif len(filtered_cities) > 1:
+        # Ajouter la moyenne des villes sélectionnées si au moins 2 villes sont sélectionnées
+        average = pd.DataFrame(
+            {
+                "Period": starts[observed],
+                "City": "Moyenne des villes sélectionnées",
+                "Total": totals.sum(axis=1)[observed] / present.sum(axis=1)[observed],
+            }
+        )
+        period_sales = pd.concat([period_sales, average], ignore_index=True)
+
+    return period_sales
+
+
+@timed("figure_line")
+def render_line(context, period_sales, resolution, window=()):
+    city_title = context["city_title"]
+
+    # Couleurs contrastées et lignes épaisses
+    return build_line(
+        period_sales,
+        resolution,
+        f"Évolution des achats {RESOLUTIONS[resolution]['title']}{city_title}",
+        window,
+    )
+
+
+@memoize
+def hist_figure(name, filter_key, date_key):
+    context = filter_context(name, filter_key, date_key)
+    return with_signature(render_hist(context, hist_data(name, filter_key, date_key)))
+
+
+@memoize
+def bar_figure(name, filter_key, date_key):
+    context = filter_context(name, filter_key, date_key)
+    return with_signature(render_bar(context, bar_data(name, filter_key, date_key)))
+
+
+@memoize
+def line_figure(name, filter_key, date_key, resolution, window, buckets):
+    context = filter_context(name, filter_key, date_key)
+    # Série complète en cache ; seuls les points visibles sont envoyés
+    period_sales = line_data(name, filter_key, date_key, resolution)
+    period_sales = visible_points(period_sales, window, buckets)
+    return with_signature(render_line(context, period_sales, resolution, window))
+
+
+def filter_keys(selections, start_date=None, end_date=None, name=None):
+    """Cache keys ``(name, filter_key, date_key)``; unknown names are the default."""
+    dataset = get_dataset(dataset_name(name))
+    return (
+        dataset.name,
+        canonical_selections(dataset, selections or {}),
+        canonical_dates(dataset, start_date, end_date),
+    )
+
+
+def state_keys(filter_state):
+    """Cache keys of the ``filter-state`` store filled in the browser."""
+    filter_state = filter_state or {}
+    return filter_keys(
+        filter_state.get("filters"),
+        filter_state.get("start"),
+        filter_state.get("end"),
+        filter_state.get("dataset"),
+    )
+
+
+def update_dashboard(
+    selected_cities,
+    selected_genders,
+    start_date=None,
+    end_date=None,
+    other_filters=None,
+    dataset=None,
+    resolution=DEFAULT_RESOLUTION,
+):
+    """Every output for the given dropdown values.
+
+    ``other_filters`` maps the other dimensions to their selected values,
+    ``dataset`` names the dataset (the default one if ``None``) and
+    ``resolution`` the periods of the line chart.
+    """
+    selections = dict(other_filters or {}, City=selected_cities)
+    selections["Gender"] = selected_genders
+    keys = filter_keys(selections, start_date, end_date, dataset)
+    context = filter_context(*keys)
+    total_sales, total_invoices = kpi_texts(*context["data_key"])
+    return (
+        total_sales,
+        total_invoices,
+        hist_figure(*keys)[0],
+        bar_figure(*keys)[0],
+        line_figure(*keys, resolution, (), LINE_BUCKETS)[0],
+    )
+
+
+# Un callback par sortie : chacun ne recalcule que ce dont il dépend. La
+# version des données les redéclenche quand de nouvelles ventes arrivent ;
+# les figures inchangées ne sont pas renvoyées (cf. figure_update).
+
+
+@app.callback(
+    Output("data-version", "data"),
+    Input("live-interval", "n_intervals"),
+    [State("filter-state", "data"), State("data-version", "data")],
+)
+def update_data_version(n_intervals, filter_state, previous):
+    stamp = get_dataset(state_keys(filter_state)[0]).stamp
+    return no_update if previous == stamp else stamp
+
+
+@app.callback(
+    [
+        Output({"type": "dimension-filter", "dimension": ALL}, "options"),
+        Output(
+            {"type": "dimension-filter", "dimension": ALL},
+            "value",
+            allow_duplicate=True,
+        ),
+        Output("date-filter", "min_date_allowed"),
+        Output("date-filter", "max_date_allowed"),
+        Output("date-filter", "initial_visible_month"),
+    ],
+    Input("dataset", "value"),
+    [
+        State({"type": "dimension-filter", "dimension": ALL}, "id"),
+        State({"type": "dimension-filter", "dimension": ALL}, "value"),
+    ],
+    prevent_initial_call=True,
 )
+def update_dataset(name, ids, values):
+    """Dropdown options and date bounds of the selected dataset.
 
+    Selected values absent from the new dataset are dropped.
+    """
+    dataset = get_dataset(dataset_name(name))
+    first, last = (bound.date() for bound in dataset.date_bounds)
+    options = [dimension_options(dataset, id["dimension"]) for id in ids]
+    kept = [
+        [
+            value
+            for value in selected or []
+            if value == "all" or value in dataset.dimension_values[id["dimension"]]
+        ]
+        for id, selected in zip(ids, values)
+    ]
+    return options, kept, first, last, last
 
-# ============================
-# Callbacks pour les mises à jour
-# ============================
 
-"""
-    Update the dashboard figures and metrics based on selected filters for cities and genders.
-    This callback function updates the following components:
-    1. Total sales (formatted as a string with currency).
-    2. Total number of unique invoices.
-    3. Histogram of total sales distribution.
-    4. Bar chart of total invoices.
-    5. Line chart showing monthly sales trends.
-    Parameters:
-    -----------
-    selected_cities : list of str
-        List of selected cities. If empty or contains "all", all cities are considered.
-    selected_genders : list of str
-        List of selected genders. If empty or contains "all", all genders are considered.
-    Returns:
-    --------
-    tuple
-        A tuple containing:
-        - total_sales (str): Total sales formatted as a string with currency (e.g., "1 234.56 USD").
-        - total_invoices (str): Total number of unique invoices formatted as a string.
-        - hist_fig (plotly.graph_objects.Figure): Histogram figure showing the distribution of total sales.
-        - bar_fig (plotly.graph_objects.Figure): Bar chart figure showing the total number of invoices.
-        - line_fig (plotly.graph_objects.Figure): Line chart figure showing the monthly sales trends.
-    Notes:
-    ------
-    - If "all" is selected for both cities and genders, the histogram bars are displayed in a single color.
-    - The bar chart and line chart adapt dynamically based on the selected filters.
-    - The function uses predefined color maps for cities and genders to ensure consistent visualization.
-    """
+@app.callback(
+    Output("total-sales", "children"),
+    [Input("filter-state", "data"), Input("data-version", "data")],
+)
+def update_total_sales(filter_state, data_version):
+    context = filter_context(*state_keys(filter_state))
+    return kpi_texts(*context["data_key"])[0]
+
+
+@app.callback(
+    Output("total-invoices", "children"),
+    [Input("filter-state", "data"), Input("data-version", "data")],
+)
+def update_total_invoices(filter_state, data_version):
+    context = filter_context(*state_keys(filter_state))
+    return kpi_texts(*context["data_key"])[1]
+
 
 @app.callback(
     [
-        Output("total-sales", "children"),
-        Output("total-invoices", "children"),
         Output("hist-total-sales", "figure"),
-        Output("bar-total-invoices", "figure"),
-        Output("line-month-sales", "figure"),
+        Output("hist-total-sales-signature", "data"),
     ],
-    [Input("city-filter", "value"), Input("gender-filter", "value")],
+    [Input("filter-state", "data"), Input("data-version", "data")],
+    State("hist-total-sales-signature", "data"),
 )
-def update_dashboard(selected_cities, selected_genders):
-    # Gestion des villes : si vide, on considère toutes les villes
-    if not selected_cities:
-        filtered_cities = df["City"].unique().tolist()
-        show_city_distinction = True
-    elif "all" in selected_cities:
-        filtered_cities = df["City"].unique().tolist()
-        show_city_distinction = False
-    else:
-        filtered_cities = selected_cities
-        show_city_distinction = True
+def update_hist(filter_state, data_version, previous):
+    keys = state_keys(filter_state)
+    return figure_update(*hist_figure(*keys), previous)
 
-    # Gestion des genres : si vide, on considère tous les genres
-    if not selected_genders:
-        filtered_genders = df["Gender"].unique().tolist()
-        show_gender_distinction = True
-    elif "all" in selected_genders:
-        filtered_genders = df["Gender"].unique().tolist()
-        show_gender_distinction = False
-    else:
-        filtered_genders = selected_genders
-        show_gender_distinction = True
 
-    filtered_df = df[
-        (df["City"].isin(filtered_cities)) & (df["Gender"].isin(filtered_genders))
-    ]
+@app.callback(
+    [
+        Output("bar-total-invoices", "figure"),
+        Output("bar-total-invoices-signature", "data"),
+    ],
+    [Input("filter-state", "data"), Input("data-version", "data")],
+    State("bar-total-invoices-signature", "data"),
+)
+def update_bar(filter_state, data_version, previous):
+    keys = state_keys(filter_state)
+    return figure_update(*bar_figure(*keys), previous)
 
-    # Calculs des indicateurs
-    total_sales = f"{filtered_df['Total'].sum():,.2f}".replace(",", " ") + " USD"
-    total_invoices = f"{filtered_df['Invoice ID'].nunique():,.0f}".replace(",", " ")
 
-    # Déterminer si on doit colorer par Genre ou Ville
-    color_var = None
-    pattern_var = None
+@app.callback(
+    [
+        Output("line-month-sales", "figure"),
+        Output("line-month-sales-signature", "data"),
+    ],
+    [
+        Input("filter-state", "data"),
+        Input("data-version", "data"),
+        Input("resolution", "value"),
+        Input("line-view", "data"),
+    ],
+    State("line-month-sales-signature", "data"),
+)
+def update_line(filter_state, data_version, resolution, view, previous):
+    keys = state_keys(filter_state)
+    if resolution not in RESOLUTIONS:
+        resolution = DEFAULT_RESOLUTION
+    return figure_update(*line_figure(*keys, resolution, *line_view(view)), previous)
 
-    if show_gender_distinction and show_city_distinction:
-        color_var = "Gender"
-        pattern_var = "City"
-    elif show_city_distinction:
-        pattern_var = "City"  # Toujours en pattern si distinction de ville
-        color_var = None  # Pas de couleur si uniquement distinction par ville
-    elif show_gender_distinction:
-        color_var = "Gender"
-        pattern_var = None  # Pas de pattern si uniquement distinction par genre
 
-    # Titres dynamiques
-    gender_translation = {"Male": "hommes", "Female": "femmes"}
-    gender_title = ""
-    if show_gender_distinction:
-        translated_genders = [gender_translation.get(g, g) for g in selected_genders]
-        if len(translated_genders) == 1:
-            gender_title = f" pour les {translated_genders[0]}"
-        else:
-            gender_title = " par genre"
+# Gestion du filtre "Tout sélectionner" (exclusif), exécutée dans le
+# navigateur : pas d'aller-retour serveur. Rien n'est renvoyé quand la
+# valeur est déjà normalisée, pour ne pas redéclencher les callbacks.
+EXCLUSIVE_ALL_JS = """
+function (selected) {
+    if (!selected) {
+        return [];  // Affiche "Sélectionner ..." mais prend toutes les valeurs
+    }
+    if (selected.includes("all") && selected.length > 1) {
+        return ["all"];  // Si "Tout sélectionner" est activé, il reste seul
+    }
+    return window.dash_clientside.no_update;
+}
+"""
 
-    city_title = ""
-    if show_city_distinction:
-        if len(selected_cities) == 1:
-            city_title = f" à {selected_cities[0]}"
-        else:
-            city_title = " par ville"
+app.clientside_callback(
+    EXCLUSIVE_ALL_JS,
+    Output({"type": "dimension-filter", "dimension": MATCH}, "value"),
+    Input({"type": "dimension-filter", "dimension": MATCH}, "value"),
+)
 
-    # Générer l'histogramme en fonction des filtres
-    gender_color_map = {
-        "Female": "#1abc9c",  # Vert
-        "Male": "#3498db",  # Bleu
-        "All": "#f1c40f",  # Jaune
+# État des filtres normalisé (tri, doublons, "Tout sélectionner") : le
+# magasin n'est mis à jour que si l'état change réellement, donc les
+# callbacks serveur ne partent qu'une fois par action de l'utilisateur.
+app.clientside_callback(
+    """
+    function (values, start, end, dataset, ids, previous) {
+        function normalize(values) {
+            if (!values || values.length === 0) {
+                return [];
+            }
+            if (values.includes("all")) {
+                return ["all"];
+            }
+            return Array.from(new Set(values)).sort();
+        }
+        // Seules les dimensions utilisées figurent dans l'état
+        var filters = {};
+        ids.forEach(function (id, i) {
+            var selected = normalize(values[i]);
+            if (selected.length) {
+                filters[id.dimension] = selected;
+            }
+        });
+        var state = {
+            dataset: dataset || null,
+            filters: filters,
+            start: start || null,
+            end: end || null
+        };
+        if (previous && JSON.stringify(previous) === JSON.stringify(state)) {
+            return window.dash_clientside.no_update;
+        }
+        return state;
     }
+    """,
+    Output("filter-state", "data"),
+    [
+        Input({"type": "dimension-filter", "dimension": ALL}, "value"),
+        Input("date-filter", "start_date"),
+        Input("date-filter", "end_date"),
+        Input("dataset", "value"),
+    ],
+    [
+        State({"type": "dimension-filter", "dimension": ALL}, "id"),
+        State("filter-state", "data"),
+    ],
+)
 
-    city_color_map = {
-        "Yangon": "#27ae60",  # Vert bien visible
-        "Naypyitaw": "#2980b9",  # Bleu foncé
-        "Mandalay": "#5dade2",  # Bleu clair, mais pas trop
-        "Moyenne des villes sélectionnées": "#f1c40f",  # Jaune doré pour bien ressortir
-        "Somme des 3 villes": "#000000",  # Noir pour un contraste maximal
+# Synchronisation de la période et du jeu de données avec l'URL, dans les
+# deux sens : au chargement l'URL remplit le sélecteur, ensuite le
+# sélecteur met l'URL à jour. Rien n'est renvoyé quand les deux sont déjà
+# d'accord, ce qui évite les boucles.
+app.clientside_callback(
+    """
+    function (search, start, end, dataset) {
+        var noUpdate = window.dash_clientside.no_update;
+        var triggered = window.dash_clientside.callback_context.triggered.map(
+            function (t) { return t.prop_id; }
+        );
+        var params = new URLSearchParams(search || "");
+        var names = ["start", "end", "dataset"];
+        var values = [start, end, dataset].map(function (value, i) {
+            return value ? (i < 2 ? value.slice(0, 10) : value) : null;
+        });
+        var fromSelectors = triggered.some(function (id) {
+            return id.indexOf("date-filter.") === 0 || id.indexOf("dataset.") === 0;
+        });
+        if (!fromSelectors) {
+            var fromUrl = names.map(function (name) { return params.get(name); });
+            if (JSON.stringify(fromUrl) === JSON.stringify(values)) {
+                return [noUpdate, noUpdate, noUpdate, noUpdate];
+            }
+            return [noUpdate].concat(fromUrl);
+        }
+        names.forEach(function (name, i) {
+            if (values[i]) {
+                params.set(name, values[i]);
+            } else {
+                params.delete(name);
+            }
+        });
+        var query = params.toString();
+        var newSearch = query ? "?" + query : "";
+        if (newSearch === (search || "")) {
+            return [noUpdate, noUpdate, noUpdate, noUpdate];
+        }
+        return [newSearch, noUpdate, noUpdate, noUpdate];
     }
+    """,
+    [
+        Output("url", "search"),
+        Output("date-filter", "start_date"),
+        Output("date-filter", "end_date"),
+        Output("dataset", "value"),
+    ],
+    [
+        Input("url", "search"),
+        Input("date-filter", "start_date"),
+        Input("date-filter", "end_date"),
+        Input("dataset", "value"),
+    ],
+)
 
-    # Création du graphique avec couleurs selon le genre et motifs selon la ville
-    hist_fig = px.histogram(
-        filtered_df,
-        x="Total",
-        color=(
-            color_var if color_var else None
-        ),  # Couleurs par genre si pas "Tout sélectionner"
-        pattern_shape=(
-            pattern_var if pattern_var else None
-        ),  # Motifs par ville si activé
-        title=f"Répartition des montants totaux des achats{gender_title}{city_title}",
-        barmode="stack",
-        color_discrete_map=gender_color_map,  # Utilisation des couleurs définies pour les genres
-        labels={
-            "Gender": "Genre",
-            "City": "Ville",
-            "Total": "Montant total des achats (USD)",
-        },
+# Vue de la courbe envoyée au serveur : largeur du graphique (arrondie à la
+# centaine de pixels, pour partager le cache) et plage zoomée de l'axe des
+# dates. Le zoom est oublié quand la période ou le jeu de données change ;
+# rien n'est renvoyé quand la vue est inchangée.
+app.clientside_callback(
+    """
+    function (relayout, start, end, dataset, view) {
+        var noUpdate = window.dash_clientside.no_update;
+        var triggered = window.dash_clientside.callback_context.triggered.map(
+            function (t) { return t.prop_id; }
+        );
+        var graph = document.getElementById("line-month-sales");
+        var width = graph && graph.offsetWidth
+            ? Math.ceil(graph.offsetWidth / 100) * 100
+            : null;
+        var range = view ? view.range : null;
+        var fromGraph = triggered.some(function (id) {
+            return id.indexOf("line-month-sales.") === 0;
+        });
+        if (!fromGraph) {
+            range = null;
+        } else if (relayout && relayout["xaxis.autorange"]) {
+            range = null;
+        } else if (relayout && relayout["xaxis.range[0]"] !== undefined) {
+            range = [relayout["xaxis.range[0]"], relayout["xaxis.range[1]"]];
+        } else if (relayout && relayout["xaxis.range"]) {
+            range = relayout["xaxis.range"];
+        }
+        var next = {width: width, range: range};
+        if (JSON.stringify(next) === JSON.stringify(view)) {
+            return noUpdate;
+        }
+        return next;
+    }
+    """,
+    Output("line-view", "data"),
+    [
+        Input("line-month-sales", "relayoutData"),
+        Input("date-filter", "start_date"),
+        Input("date-filter", "end_date"),
+        Input("dataset", "value"),
+    ],
+    State("line-view", "data"),
+)
+
+
+# ============================
+# Export des données filtrées
+# ============================
+
+# Lignes lues, filtrées et écrites à la fois : borne la mémoire d'un export
+EXPORT_CHUNK_ROWS = int(os.environ.get("DASHBOARD_EXPORT_CHUNK_ROWS", "50000"))
+
+
+def export_keys(args):
+    """Cache keys of the query string of ``/export``.
+
+    Each filter dimension is a repeatable parameter named after its column
+    (``?City=Yangon&City=Mandalay``), the period is ``start`` and ``end``
+    and the dataset ``dataset``: the values of the selectors.
+    """
+    selections = {dim: args.getlist(dim) for dim in FILTER_DIMENSIONS}
+    return filter_keys(
+        selections, args.get("start"), args.get("end"), args.get("dataset")
     )
 
-    hist_fig.update_layout(yaxis_title="Nombre d'achats (factures)")
-    hist_fig.update_layout(legend_traceorder="reversed")
 
-    # 1. Si "Tout sélectionner" est activé pour le genre ET pour la ville → tout devient jaune
-    if "all" in selected_genders and "all" in selected_cities:
-        hist_fig.update_traces(
-            marker=dict(
-                color=city_color_map["Moyenne des villes sélectionnées"],
-                pattern_shape=None,  # Suppression des motifs
-            )
+def export_chunks(dataset, restrictions, date_key, columns):
+    """Matching rows of ``columns``, ``EXPORT_CHUNK_ROWS`` at a time.
+
+    Rows are sliced and filtered chunk by chunk: the filtered DataFrame is
+    never built.
+    """
+    if dataset.database:
+        yield from sqlite_backend.iter_rows(
+            dataset.database, restrictions, date_key, columns, EXPORT_CHUNK_ROWS
         )
+        return
+    # Les ajouts de ventes créent un nouveau df : celui-ci reste cohérent
+    with dataset.lock:
+        data = dataset.df
+        start, stop = date_slice(data["Date"], date_key)
+        selection = select_rows(dataset, dict(restrictions))
+        text_columns = dataset.text_columns
+    for first in range(start, stop, EXPORT_CHUNK_ROWS):
+        last = min(first + EXPORT_CHUNK_ROWS, stop)
+        chunk = data.iloc[first:last]
+        mask = None if selection is None else selection_mask(selection, first, last)
+        if mask is not None:
+            chunk = chunk[mask]
+        # Colonnes de texte projetées : décodées tranche par tranche
+        texts = {}
+        for name, values in text_columns.items():
+            values = values[first:last] if mask is None else values[first:last][mask]
+            texts[name] = np.char.decode(values, "utf-8")
+        yield chunk.assign(**texts)[columns]
 
-    # 2. Si "Tout sélectionner" est activé uniquement pour le genre → chaque barre a la couleur des villes
-    elif "all" in selected_genders:
-        hist_fig.for_each_trace(
-            lambda trace: trace.update(
-                marker=dict(
-                    color=city_color_map.get(
-                        trace.name, "#000000"
-                    ),  # Appliquer la couleur de la ville
-                    pattern_shape=None,  # Suppression des motifs
-                )
+
+def csv_stream(chunks, columns):
+    yield ",".join(columns) + "\n"
+    for chunk in chunks:
+        yield chunk.to_csv(index=False, header=False, date_format="%Y-%m-%d")
+
+
+class StreamSink(io.RawIOBase):
+    """Write-only file whose content is taken out by ``drain``.
+
+    ``tell`` still counts every byte written, as the Parquet footer needs.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.parts, self.position = [], 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data, self.parts = b"".join(self.parts), []
+        return data
+
+
+def parquet_stream(chunks, columns):
+    """Parquet file of ``chunks``, one row group per chunk."""
+    schema = pa.schema(
+        [
+            (
+                column,
+                (
+                    pa.dictionary(pa.int32(), pa.string())
+                    if column in CATEGORICAL_COLUMNS
+                    else {"Total": pa.float64(), "Date": pa.date32()}.get(
+                        column, pa.string()
+                    )
+                ),
+            )
+            for column in columns
+        ]
+    )
+    sink = StreamSink()
+    with pq.ParquetWriter(sink, schema) as writer:
+        for chunk in chunks:
+            writer.write_table(
+                pa.Table.from_pandas(chunk, schema=schema, preserve_index=False)
             )
+            yield sink.drain()
+    yield sink.drain()
+
+
+@server.route("/export")
+def export():
+    """Sales matching the filters of the query string, as CSV or Parquet.
+
+    The file is streamed chunk by chunk, so its size does not weigh on
+    the memory of the worker.
+    """
+    fmt = request.args.get("format", "csv")
+    if fmt not in EXPORT_FORMATS:
+        return Response(
+            f"Format inconnu : {fmt} (disponibles : {', '.join(EXPORT_FORMATS)})",
+            status=400,
+            mimetype="text/plain",
+        )
+    name = request.args.get("dataset")
+    if name and dataset_name(name) != name:
+        return Response(
+            f"Jeu de données inconnu : {name}", status=404, mimetype="text/plain"
         )
+    name, restrictions, date_key = filter_context(*export_keys(request.args))[
+        "data_key"
+    ]
+    dataset = get_dataset(name)
+    # Les colonnes de USECOLS, quel que soit le stockage
+    chunks = export_chunks(dataset, restrictions, date_key, USECOLS)
+    mimetype, extension = EXPORT_FORMATS[fmt]
+    if METRICS_ENABLED:
+        increment("dashboard_exports_total", (("format", fmt),))
+    return Response(
+        (csv_stream if fmt == "csv" else parquet_stream)(chunks, USECOLS),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f'attachment; filename="ventes.{extension}"'},
+    )
 
-    # 3. Si "Tout sélectionner" est activé uniquement pour la ville → couleurs du genre, mais sans motifs
-    elif "all" in selected_cities:
-        hist_fig.for_each_trace(
-            lambda trace: trace.update(
-                marker=dict(
-                    color=gender_color_map.get(trace.name, "#000000"),
-                    pattern_shape=None,  # Suppression des motifs
+
+# Liens d'export à jour des filtres, construits dans le navigateur
+app.clientside_callback(
+    """
+    function (state, ids) {
+        var params = new URLSearchParams();
+        state = state || {};
+        if (state.dataset) {
+            params.set("dataset", state.dataset);
+        }
+        Object.keys(state.filters || {}).forEach(function (dim) {
+            state.filters[dim].forEach(function (value) {
+                params.append(dim, value);
+            });
+        });
+        ["start", "end"].forEach(function (name) {
+            if (state[name]) {
+                params.set(name, state[name].slice(0, 10));
+            }
+        });
+        return ids.map(function (id) {
+            params.set("format", id.format);
+            return "/export?" + params.toString();
+        });
+    }
+    """,
+    Output({"type": "export-link", "format": ALL}, "href"),
+    Input("filter-state", "data"),
+    State({"type": "export-link", "format": ALL}, "id"),
+)
+
+
+# ============================
+# Préchauffage des caches
+# ============================
+
+# Calcul au démarrage des combinaisons de filtres les plus courantes, pour
+# que le premier utilisateur ne tombe pas sur un cache vide
+WARMUP = os.environ.get("DASHBOARD_WARMUP", "1") == "1"
+# Nombre maximal de combinaisons préchauffées (borné par DASHBOARD_CACHE_SIZE)
+WARMUP_LIMIT = int(os.environ.get("DASHBOARD_WARMUP_LIMIT", "64"))
+WARMUP_WORKERS = int(os.environ.get("DASHBOARD_WARMUP_WORKERS", "4"))
+
+
+def dimension_keys(values):
+    """Canonical keys of one display dimension, smallest selections first.
+
+    No selection, "all", then the subsets of ``values`` by increasing size
+    (the full set is the same key as no selection). Generated lazily, so
+    only the first keys are enumerated for high cardinalities.
+    """
+    yield ()
+    yield ("all",)
+    for size in range(1, len(values)):
+        for subset in itertools.combinations(values, size):
+            yield tuple(sorted(subset))
+
+
+def warm_up_keys(dataset, limit):
+    """The ``limit`` most common filter keys of ``dataset``, over the whole period.
+
+    Combinations of the display dimensions, ordered by the number of
+    selected values, without any other filter.
+    """
+    candidates = [
+        [
+            (dim, key)
+            for key in itertools.islice(
+                dimension_keys(dataset.dimension_values[dim]), limit
+            )
+        ]
+        for dim in DISPLAY_DIMENSIONS
+    ]
+    combinations = sorted(
+        itertools.product(*candidates),
+        key=lambda combination: sum(len(key) for _, key in combination),
+    )[:limit]
+    return [
+        filter_keys({dim: list(key) for dim, key in combination}, name=dataset.name)
+        for combination in combinations
+    ]
+
+
+def warm(keys, version):
+    # Un jeu de données libéré ou changé entre-temps n'est pas rechargé ni
+    # préchauffé pour rien : le nouveau préchauffage prend le relais
+    dataset = DATASETS.get(keys[0])
+    if dataset is None or dataset.version != version:
+        return
+    NO_LOAD.active = True
+    try:
+        context = filter_context(*keys)
+        kpi_texts(*context["data_key"])
+        hist_figure(*keys)
+        bar_figure(*keys)
+        # Résolution affichée à l'ouverture de la page
+        line_figure(*keys, DEFAULT_RESOLUTION, (), LINE_BUCKETS)
+    except KeyError:
+        pass
+
+
+def warm_up(name=DEFAULT_DATASET, limit=WARMUP_LIMIT, workers=WARMUP_WORKERS):
+    """Fill the result caches for the ``warm_up_keys`` on a thread pool.
+
+    Threads, not processes: the caches live in the memory of this process.
+    """
+    dataset = DATASETS.get(name)
+    if dataset is None:
+        return
+    keys = warm_up_keys(dataset, min(limit, CACHE_SIZE))
+    version = dataset.version
+    del dataset
+    start = time.perf_counter()
+    logger.info("Préchauffage de %d combinaisons de filtres de %s", len(keys), name)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(warm, key, version) for key in keys]
+        step = max(1, len(keys) // 10)
+        for done, future in enumerate(as_completed(futures), 1):
+            try:
+                future.result()
+            except Exception:
+                logger.exception("Échec du préchauffage")
+            if done % step == 0 or done == len(keys):
+                logger.info(
+                    "Préchauffage : %d/%d combinaisons (%.1f s)",
+                    done,
+                    len(keys),
+                    time.perf_counter() - start,
+                )
+    logger.info("Préchauffage terminé en %.1f s", time.perf_counter() - start)
+
+
+# Jeux de données en cours de préchauffage -> à relancer une fois fini
+WARMING = {}
+WARMING_LOCK = threading.Lock()
+
+
+def start_warm_up(dataset):
+    """Run ``warm_up`` in the background: requests are served meanwhile.
+
+    At most one warm-up per dataset runs at a time: the requests made
+    meanwhile are coalesced into a single new run once it ends.
+    """
+    if not WARMUP:
+        return
+    with WARMING_LOCK:
+        if dataset.name in WARMING:
+            WARMING[dataset.name] = True
+            return
+        WARMING[dataset.name] = False
+    threading.Thread(
+        target=warm_up_until_current,
+        args=(dataset.name,),
+        name="warm-up",
+        daemon=True,
+    ).start()
+
+
+def warm_up_until_current(name):
+    """``warm_up`` again as long as new warm-ups were requested meanwhile."""
+    while True:
+        warm_up(name)
+        with WARMING_LOCK:
+            if not WARMING.pop(name):
+                return
+            WARMING[name] = False
+
+
+# Préchauffage au démarrage et après chaque chargement ou changement d'un
+# jeu de données (ses anciens résultats viennent d'être retirés des caches
+# par discard_results)
+RELOAD_HOOKS.append(start_warm_up)
+start_warm_up(get_dataset())
+
+
+# ============================
+# Ingestion en continu
+# ============================
+
+
+def live_supported(dataset):
+    """Live ingestion needs the sales in memory, in a private copy."""
+    return dataset.df is not None and not dataset.shared and not streams(dataset.path)
+
+
+def follow(dataset):
+    """Follow the CSV of ``dataset`` from where it was loaded.
+
+    The default dataset also takes the files of ``DROP_DIR``, from scratch.
+    """
+    with open(dataset.path, "rb") as f:
+        header = pd.read_csv(io.BytesIO(f.readline()), nrows=0).columns.tolist()
+    dataset.live.update(
+        path=dataset.path,
+        offset=dataset.size,
+        header=header,
+        drop_dir=DROP_DIR if dataset.name == DEFAULT_DATASET else "",
+        seen=set(),
+    )
+
+
+def read_new_sales(live):
+    """Rows appended to the followed CSV and files newly dropped in its drop dir.
+
+    ``live`` is the state of ``follow``. Only the bytes after the last
+    complete line read so far are parsed. Returns ``None`` when the CSV
+    shrank: it was rewritten, not appended to.
+    """
+    dtype = {column: "category" for column in CATEGORICAL_COLUMNS}
+    frames = []
+    size = os.path.getsize(live["path"])
+    if size < live["offset"]:
+        return None
+    if size > live["offset"]:
+        with open(live["path"], "rb") as f:
+            f.seek(live["offset"])
+            data = f.read(size - live["offset"])
+        # Une ligne en cours d'écriture sera lue au tic suivant
+        end = data.rfind(b"\n") + 1
+        if end:
+            frames.append(
+                pd.read_csv(
+                    io.BytesIO(data[:end]),
+                    names=live["header"],
+                    header=None,
+                    usecols=USECOLS,
+                    dtype=dtype,
                 )
             )
-        )
+            live["offset"] += end
+    # Les fichiers doivent être déposés d'un bloc (écriture puis renommage)
+    if live["drop_dir"] and os.path.isdir(live["drop_dir"]):
+        for name in sorted(os.listdir(live["drop_dir"])):
+            if name.endswith(".csv") and name not in live["seen"]:
+                frames.append(
+                    pd.read_csv(
+                        os.path.join(live["drop_dir"], name),
+                        usecols=USECOLS,
+                        dtype=dtype,
+                    )
+                )
+                live["seen"].add(name)
+    return frames
 
-    # Barre des achats totaux (Empilement : Sexe → Ville)
-    # Reclasser pour que "Male" soit en bas et "Female" en haut
 
-    # Vérification si "Tout sélectionner" est activé pour Genre
-    if "all" in selected_genders:
-        bar_fig = px.bar(
-            filtered_df.groupby(["City"])["Invoice ID"].count().reset_index(),
-            x="City",
-            y="Invoice ID",
-            color="City",
-            title=f"Nombre total d'achats (factures) {city_title}",
-            barmode="stack",
-            labels={"Invoice ID": "Nombre d'achats (factures)", "City": "Ville"},
-            color_discrete_map=city_color_map,  # Utilisation des couleurs des villes
-        )
-    else:
+def codes_dtype(categories):
+    """Integer type pandas keeps, without copy, for ``categories`` codes."""
+    for dtype in (np.int8, np.int16, np.int32):
+        if len(categories) < np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+
+
+def reserve(buffer, length):
+    """``buffer``, or a copy twice as long when it cannot hold ``length``."""
+    if length <= len(buffer):
+        return buffer
+    grown = np.zeros(max(length, 2 * len(buffer)), dtype=buffer.dtype)
+    grown[: len(buffer)] = buffer
+    return grown
 
-        if show_city_distinction and show_gender_distinction:
-            bar_fig = px.bar(
-                filtered_df.groupby(["City", "Gender"])["Invoice ID"]
-                .count()
-                .reset_index(),
-                x="City",
-                y="Invoice ID",
-                color="Gender",
-                title=f"Nombre total d'achats (factures){gender_title}{city_title}",
-                barmode="stack",
-                labels={
-                    "Invoice ID": "Nombre d'achats (factures)",
-                    "City": "Ville",
-                    "Gender": "Genre",
-                },
-                color_discrete_map=gender_color_map,  # Utilisation des couleurs des genres
+
+def append_sales(dataset, new):
+    """Add the sales of ``new`` to the ``df``, cube and bitmap index of ``dataset``.
+
+    The columns of ``df`` live in buffers that double when full, so adding
+    rows copies only them (amortized): ``df`` is rebuilt as views on the
+    buffers. Only the cube rows of the dates of ``new`` are aggregated
+    again and only the bytes of the bitsets covering the new rows are
+    written. Sales older than the last date need a full re-sort. Invoices
+    are assumed new, so distinct counts keep adding up.
+    """
+    new = derive_columns(new).sort_values("Date", kind="stable", ignore_index=True)
+    if new.empty:
+        return
+    with dataset.lock:
+        df = dataset.df
+        rows, added = len(df), len(new)
+        if rows and new["Date"].min() < df["Date"].iloc[-1]:
+            logger.warning(
+                "%d ventes antérieures à la dernière date : reconstruction complète",
+                added,
             )
-        elif show_city_distinction:
-            bar_fig = px.bar(
-                filtered_df.groupby(["City"])["Invoice ID"].count().reset_index(),
-                x="City",
-                y="Invoice ID",
-                color="City",
-                title=f"Nombre total d'achats (factures) {city_title}",
-                barmode="stack",
-                labels={"Invoice ID": "Nombre d'achats (factures)", "City": "Ville"},
-                color_discrete_map=city_color_map,  # Utilisation des couleurs des villes
+            categorical = {name: object for name in CATEGORICAL_COLUMNS}
+            merged = pd.concat(
+                [df.astype(categorical), new.astype(categorical)], ignore_index=True
             )
-        elif show_gender_distinction:
-            bar_fig = px.bar(
-                filtered_df.groupby(["City", "Gender"])["Invoice ID"]
-                .count()
-                .reset_index(),
-                x="City",
-                y="Invoice ID",
-                color="Gender",
-                title=f"Nombre total d'achats (factures){gender_title}",
-                barmode="stack",
-                labels={
-                    "Invoice ID": "Nombre d'achats (factures)",
-                    "City": "Ville",
-                    "Gender": "Genre",
-                },
-                color_discrete_map=gender_color_map,  # Utilisation des couleurs des genres
+            data = derive_columns(
+                merged.astype({column: "category" for column in CATEGORICAL_COLUMNS})
             )
+            data = data.sort_values("Date", kind="stable", ignore_index=True)
+            data.attrs["order"] = {
+                column: list(
+                    dict.fromkeys(
+                        df.attrs["order"][column] + new[column].unique().tolist()
+                    )
+                )
+                for column in CATEGORICAL_COLUMNS
+            }
+            dataset.df, dataset.cube = data, build_cube(data)
+            dataset.bitmap_index = build_bitmap_index(data, FILTER_DIMENSIONS)
+            dataset.live["buffers"], dataset.live["bitsets"] = {}, {}
         else:
-            bar_fig = px.bar(
-                filtered_df.groupby("City")["Invoice ID"].count().reset_index(),
-                x="City",
-                y="Invoice ID",
-                title="Nombre total d'achats (factures)",
-                labels={"Invoice ID": "Nombre d'achats (factures)", "City": "Ville"},
-                color_discrete_map=city_color_map,  # Utilisation des couleurs des villes par défaut
+            dataset.df, dataset.cube, dataset.bitmap_index = extend_dataset(
+                dataset, new, rows, added
             )
+        df = dataset.df
+        refresh_dataset(
+            dataset,
+            df.attrs["order"],
+            df["Date"].iloc[0],
+            df["Date"].iloc[-1],
+            len(df),
+        )
+        # Mémoire des tampons, capacité comprise : le budget s'applique aussi
+        # aux jeux de données qui grandissent
+        dataset.nbytes = dataset_bytes(dataset)
+    # Seuls les anciens résultats de ce jeu de données sont retirés, sans
+    # préchauffage : les vues ouvertes sont recalculées à la demande, pour
+    # un coût lié aux combinaisons affichées et non à tout le cache
+    discard_results(dataset)
+    set_gauge("dashboard_dataset_bytes", (("dataset", dataset.name),), dataset.nbytes)
+    evict_datasets()
 
-    # Réorganiser la légende pour que "Male" soit en bas et "Female" en haut
-    bar_fig.update_layout(legend_traceorder="reversed")
-
-    # Graphique de l'évolution des achats par mois)
-    # Définition des couleurs avec plus de contraste
 
-    # Regrouper par mois et ville
-    month_sales = filtered_df.groupby(["Month", "City"])["Total"].sum().reset_index()
+def extend_dataset(dataset, new, rows, added):
+    """Fast path of ``append_sales``: ``new`` starts at or after the last date."""
+    df, cube, bitmap_index = dataset.df, dataset.cube, dataset.bitmap_index
+    buffers = dataset.live.setdefault("buffers", {})
+    all_bitsets = dataset.live.setdefault("bitsets", {})
+    if not buffers:
+        # Première addition : copie des colonnes et de l'index dans des tampons
+        dataset.live["text_bytes"] = 0
+        for name in df.columns:
+            column = df[name]
+            if isinstance(column.dtype, pd.CategoricalDtype):
+                buffers[name] = (
+                    column.cat.codes.to_numpy().copy(),
+                    column.cat.categories.tolist(),
+                )
+            else:
+                buffers[name] = (column.to_numpy().copy(), None)
+                if buffers[name][0].dtype == object:
+                    dataset.live["text_bytes"] += text_bytes(buffers[name][0])
+        for dim, bitsets in bitmap_index.items():
+            all_bitsets[dim] = {value: bits.copy() for value, bits in bitsets.items()}
 
-    # Vérifier si "Tout sélectionner" est activé
-    if "all" in selected_cities:
-        # Afficher uniquement la somme des 3 villes
-        month_sum = month_sales.groupby("Month")["Total"].sum().reset_index()
-        month_sum["City"] = "Somme des 3 villes"
-        month_sales = month_sum
-    else:
-        num_selected_cities = len(filtered_cities)
+    total = rows + added
+    columns = {}
+    order = {name: list(values) for name, values in df.attrs["order"].items()}
+    for name in df.columns:
+        values, categories = buffers[name]
+        column = new[name]
+        if categories is not None:
+            # Nouvelles valeurs ajoutées en fin de catégories
+            present = column.unique().dropna().tolist()
+            categories = categories + [v for v in present if v not in categories]
+            if name in order:
+                order[name] += [v for v in present if v not in order[name]]
+            position = {value: code for code, value in enumerate(categories)}
+            lookup = np.array([position[v] for v in column.cat.categories], dtype=int)
+            new_values = lookup[column.cat.codes.to_numpy()]
+            values = reserve(values.astype(codes_dtype(categories), copy=False), total)
+        else:
+            new_values = column.to_numpy(dtype=values.dtype)
+            values = reserve(values, total)
+            if values.dtype == object:
+                dataset.live["text_bytes"] += text_bytes(new_values)
+        values[rows:total] = new_values
+        buffers[name] = (values, categories)
+        if categories is not None:
+            columns[name] = pd.Categorical.from_codes(
+                values[:total], categories=categories, validate=False
+            )
+        else:
+            # dtype explicite : pas de conversion (copie) des chaînes
+            columns[name] = pd.Series(values[:total], dtype=values.dtype, copy=False)
+    data = pd.DataFrame(columns, copy=False)
+    data.attrs["order"] = order
 
-        # Ajouter la moyenne des villes sélectionnées si au moins 2 villes sont sélectionnées
-        if num_selected_cities > 1:
-            month_avg = month_sales.groupby("Month")["Total"].mean().reset_index()
-            month_avg["City"] = "Moyenne des villes sélectionnées"
-            month_sales = pd.concat([month_sales, month_avg])
-
-    # Création du graphique avec des couleurs contrastées et des lignes épaisses
-    line_fig = px.line(
-        month_sales,
-        x="Month",
-        y="Total",
-        color="City",
-        title=f"Évolution des achats par mois{city_title}",
-        color_discrete_map=city_color_map,
-        labels={
-            "Month": "Temps (Mois-Année)",
-            "Total": "Montant total des achats (USD)",
-            "City": "Ville",
-        },
-        line_shape="linear",
+    # Cube : seules les dates touchées sont agrégées à nouveau
+    categorical = {
+        name: data[name].dtype for name in CUBE_KEYS if name in CATEGORICAL_COLUMNS
+    }
+    old_cube = cube.astype(categorical)
+    partial = build_cube(data.iloc[rows:])
+    split = int(
+        np.searchsorted(
+            old_cube["Date"].to_numpy(), partial["Date"].iloc[0].to_datetime64()
+        )
     )
+    tail = (
+        pd.concat([old_cube.iloc[split:], partial], ignore_index=True)
+        .groupby(CUBE_KEYS, observed=True, sort=True)
+        .sum()
+        .reset_index()
+    )
+    new_cube = pd.concat([old_cube.iloc[:split], tail], ignore_index=True)
 
-    # Rendre les lignes plus épaisses et visibles
-    line_fig.update_traces(line=dict(width=5))
-
-    return total_sales, total_invoices, hist_fig, bar_fig, line_fig
-
-
-# Gestion du filtre "Tout sélectionner" (exclusif)
-@app.callback(
-    Output("city-filter", "value"),
-    Input("city-filter", "value"),
-)
-def update_city_filter(selected_cities):
-    if not selected_cities:
-        return []  # Affiche "Sélectionner ..." mais prend toutes les villes
+    # Index bitmap : octets couvrant les nouvelles lignes
+    index = {}
+    first_byte = rows // 8
+    for dim, bitsets in all_bitsets.items():
+        codes, categories = buffers[dim]
+        tail_codes = codes[first_byte * 8 : total]
+        for code, value in enumerate(categories):
+            bits = reserve(
+                bitsets.get(value, np.zeros(0, dtype=np.uint8)), (total + 7) // 8
+            )
+            bits[first_byte : (total + 7) // 8] = np.packbits(tail_codes == code)
+            bitsets[value] = bits
+        index[dim] = {value: bitsets[value][: (total + 7) // 8] for value in categories}
+    return data, new_cube, index
 
-    if "all" in selected_cities and len(selected_cities) > 1:
-        return ["all"]  # Si "Tout sélectionner" est activé, il reste seul
 
-    return selected_cities
+def ingest_new_sales(dataset):
+    """Apply the new sales, or reload everything if the CSV was rewritten."""
+    if not dataset.live:
+        follow(dataset)
+    start = time.perf_counter()
+    frames = read_new_sales(dataset.live)
+    if frames is None:
+        logger.info("Fichier de ventes de %s réécrit : rechargement", dataset.name)
+        store_dataset(load_dataset(dataset.name, dataset.path))
+        return
+    new = [frame for frame in frames if not frame.empty]
+    if not new:
+        return
+    append_sales(dataset, pd.concat(new, ignore_index=True) if len(new) > 1 else new[0])
+    logger.info(
+        "%d nouvelles ventes ajoutées à %s en %.1f ms",
+        sum(len(frame) for frame in new),
+        dataset.name,
+        (time.perf_counter() - start) * 1000,
+    )
 
 
-@app.callback(
-    Output("gender-filter", "value"),
-    Input("gender-filter", "value"),
-)
-def update_gender_filter(selected_genders):
-    if not selected_genders:
-        return []  # Affiche "Sélectionner ..." mais prend tous les genres
+def watch_sales():
+    """Follow every loaded dataset that supports it, every ``LIVE_SECONDS``."""
+    while True:
+        time.sleep(LIVE_SECONDS)
+        with DATASETS_LOCK:
+            datasets = list(DATASETS.values())
+        for dataset in datasets:
+            if not live_supported(dataset):
+                continue
+            try:
+                ingest_new_sales(dataset)
+            except Exception:
+                logger.exception(
+                    "Échec de l'ingestion des nouvelles ventes de %s", dataset.name
+                )
 
-    if "all" in selected_genders and len(selected_genders) > 1:
-        return ["all"]  # Si "Tout sélectionner" est activé, il reste seul
 
-    return selected_genders
+if LIVE_SECONDS:
+    if not live_supported(get_dataset()):
+        logger.warning(
+            "Suivi des nouvelles ventes indisponible avec des données partagées, "
+            "projetées depuis le disque ou dans SQLite"
+        )
+    if BACKEND != "sqlite":
+        threading.Thread(target=watch_sales, name="live-sales", daemon=True).start()
 
 
 # ============================
@@ -550,4 +3731,5 @@ def update_gender_filter(selected_genders):
 # ============================
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
     app.run_server(debug=False, host="0.0.0.0", port=8080)
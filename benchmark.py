@@ -0,0 +1,404 @@
+"""Benchmarks of the sales dashboard.
+
+Generate synthetic data shaped like ``supermarket_sales.csv``::
+
+    python benchmark.py generate --rows 1000000 --out bench/sales_1m.csv
+
+Time the startup and every filter combination of the callbacks, and write
+the results as JSON::
+
+    python benchmark.py run --data bench/sales_1m.csv --out bench/1m.json
+    python benchmark.py run --rows 1000 100000 --out bench/results.json
+
+Compare two result files (e.g. from two commits)::
+
+    python benchmark.py compare bench/before.json bench/after.json
+"""
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+SIZES = {"1k": 1_000, "100k": 100_000, "1m": 1_000_000, "10m": 10_000_000}
+
+CITY_NAMES = ["Yangon", "Naypyitaw", "Mandalay"]
+GENDER_NAMES = ["Female", "Male"]
+PRODUCT_LINES = [
+    "Health and beauty",
+    "Electronic accessories",
+    "Home and lifestyle",
+    "Sports and travel",
+    "Food and beverages",
+    "Fashion accessories",
+]
+PAYMENTS = ["Ewallet", "Cash", "Credit card"]
+
+# Étapes mesurées pour chaque combinaison de filtres
+STAGES = ["filter", "aggregate", "figure", "serialize", "compress"]
+# Tailles des réponses d'une interaction : JSON, puis compressé en gzip
+SIZES_MEASURED = ["bytes", "gzip_bytes"]
+
+
+# =======================
+# Génération des données
+# =======================
+
+
+def dimension_values(base, count, prefix):
+    return base[:count] + [f"{prefix} {i}" for i in range(len(base) + 1, count + 1)]
+
+
+def generate_chunk(rng, start, rows, cities, genders, days):
+    """One chunk of synthetic sales, with the columns of the real CSV."""
+    city_codes = rng.integers(len(cities), size=rows)
+    unit_price = np.round(rng.uniform(10, 100, size=rows), 2)
+    quantity = rng.integers(1, 11, size=rows)
+    cogs = np.round(unit_price * quantity, 2)
+    tax = np.round(cogs * 0.05, 4)
+
+    ids = np.arange(start, start + rows)
+    first_day = pd.Timestamp("2019-01-01")
+    day_offsets = rng.integers(days, size=rows)
+    day_labels = np.array(
+        [f"{d.month}/{d.day}/{d.year}" for d in pd.date_range(first_day, periods=days)]
+    )
+    minutes = rng.integers(10 * 60, 21 * 60, size=rows)
+
+    return pd.DataFrame(
+        {
+            "Invoice ID": pd.Series(ids)
+            .map("{:09d}".format)
+            .str.replace(r"(\d{3})(\d{2})(\d{4})", r"\1-\2-\3", regex=True),
+            "Branch": np.array([chr(ord("A") + i % 26) for i in range(len(cities))])[
+                city_codes
+            ],
+            "City": np.array(cities)[city_codes],
+            "Customer type": np.array(["Member", "Normal"])[rng.integers(2, size=rows)],
+            "Gender": np.array(genders)[rng.integers(len(genders), size=rows)],
+            "Product line": np.array(PRODUCT_LINES)[
+                rng.integers(len(PRODUCT_LINES), size=rows)
+            ],
+            "Unit price": unit_price,
+            "Quantity": quantity,
+            "Tax 5%": tax,
+            "Total": np.round(cogs + tax, 4),
+            "Date": day_labels[day_offsets],
+            "Time": [f"{m // 60:02d}:{m % 60:02d}" for m in minutes],
+            "Payment": np.array(PAYMENTS)[rng.integers(len(PAYMENTS), size=rows)],
+            "cogs": cogs,
+            "gross margin percentage": 4.761904762,
+            "gross income": tax,
+            "Rating": np.round(rng.uniform(4, 10, size=rows), 1),
+        }
+    )
+
+
+def generate(path, rows, cities=3, genders=2, days=89, seed=0, chunk_size=500_000):
+    """Write ``rows`` synthetic sales to ``path``, chunk by chunk."""
+    rng = np.random.default_rng(seed)
+    city_names = dimension_values(CITY_NAMES, cities, "City")
+    gender_names = dimension_values(GENDER_NAMES, genders, "Gender")
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    for start in range(0, rows, chunk_size):
+        chunk = generate_chunk(
+            rng,
+            start,
+            min(chunk_size, rows - start),
+            city_names,
+            gender_names,
+            days,
+        )
+        chunk.to_csv(
+            path, mode="w" if start == 0 else "a", header=start == 0, index=False
+        )
+    return path
+
+
+# =======================
+# Mesures
+# =======================
+
+
+class Timer:
+    def __init__(self):
+        self.timings = {}
+
+    def __call__(self, stage, func, *args):
+        start = time.perf_counter()
+        result = func(*args)
+        self.timings[stage] = self.timings.get(stage, 0.0) + time.perf_counter() - start
+        return result
+
+
+def import_app(path, snapshot_dir):
+    """Import ``app`` on ``path`` (the module loads its data at import)."""
+    os.environ["DASHBOARD_DATA"] = path
+    os.environ["DASHBOARD_SNAPSHOT_DIR"] = snapshot_dir
+    # Mesures à froid : pas de préchauffage en arrière-plan
+    os.environ["DASHBOARD_WARMUP"] = "0"
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import app
+
+    return app
+
+
+def clear_caches(app):
+    for cached in app.CACHED_FUNCTIONS:
+        cached.cache_clear()
+
+
+def time_startup(app, path):
+    """Startup stages: CSV read, Date parsing, calendar, cube, snapshot."""
+    timer = Timer()
+    data = timer(
+        "read_csv",
+        lambda: pd.read_csv(
+            path,
+            usecols=app.USECOLS,
+            dtype={column: "category" for column in app.CATEGORICAL_COLUMNS},
+        ),
+    )
+    data["Date"] = timer("parse_dates", pd.to_datetime, data["Date"])
+    timer("build_calendar", app.build_calendar, data["Date"].min(), data["Date"].max())
+    timer("build_cube", app.build_cube, data)
+
+    # Chargement complet : premier appel (écriture de l'instantané) puis
+    # second appel (lecture de l'instantané)
+    def load_data():
+        app.store_dataset(app.load_dataset(app.DEFAULT_DATASET, path))
+
+    timer("load_data_cold", load_data)
+    timer("load_data_snapshot", load_data)
+    timings = dict(timer.timings)
+    dataset = app.get_dataset()
+    if dataset.df is not None:
+        timings["memory_bytes"] = int(dataset.df.memory_usage(deep=True).sum())
+    return timings
+
+
+def filter_combinations(values, max_subset):
+    """Canonical filter keys: no selection, "all" and the subsets of values."""
+    keys = [(), ("all",)]
+    for size in range(1, min(len(values) - 1, max_subset) + 1):
+        keys += [
+            tuple(sorted(subset)) for subset in itertools.combinations(values, size)
+        ]
+    return keys
+
+
+def time_callback(app, city_key, gender_key):
+    """Stage timings of one uncached evaluation of every output."""
+    # Sérialisation faite par Dash pour les sorties des callbacks
+    from plotly.io.json import to_json_plotly
+
+    clear_caches(app)
+    timer = Timer()
+    # Période complète : la clé de dates canonique est vide
+    keys = app.filter_keys({"City": city_key, "Gender": gender_key})
+    context = app.filter_context(*keys)
+    timer("filter", app.filtered_data, *context["data_key"])
+    timer("aggregate", app.kpi_texts, *context["data_key"])
+    hist = timer("aggregate", app.hist_data, *keys)
+    bar = timer("aggregate", app.bar_data, *keys)
+    line = timer("aggregate", app.line_data, *keys, app.DEFAULT_RESOLUTION)
+    figures = [
+        timer("figure", app.render_hist, context, hist),
+        timer("figure", app.render_bar, context, bar),
+        timer("figure", app.render_line, context, line, app.DEFAULT_RESOLUTION),
+    ]
+    # Signature des figures (mises à jour partielles) et JSON envoyé
+    payload = [
+        timer("serialize", lambda fig: to_json_plotly(app.with_signature(fig)), fig)
+        for fig in figures
+    ]
+    compressed = [
+        timer("compress", app.compress_body, text.encode(), "gzip") for text in payload
+    ]
+    timings = dict(timer.timings)
+    timings["total"] = sum(timer.timings.values())
+    timings["bytes"] = sum(len(text) for text in payload)
+    timings["gzip_bytes"] = sum(len(data) for data in compressed)
+    return timings
+
+
+def summarize(callbacks):
+    summary = {}
+    for stage in STAGES + ["total"] + SIZES_MEASURED:
+        values = sorted(entry[stage] for entry in callbacks)
+        summary[stage] = {
+            "median": statistics.median(values),
+            "p95": values[min(len(values) - 1, int(0.95 * len(values)))],
+            "max": values[-1],
+        }
+    return summary
+
+
+def run(path, repeat, max_subset, snapshot_dir):
+    """Benchmark one dataset; runs in a fresh process per dataset."""
+    app = import_app(path, snapshot_dir)
+    dataset = app.get_dataset()
+    if dataset.database:
+        rows = app.sqlite_backend.read_meta(dataset.database)["rows"]
+    else:
+        rows = len(dataset.df)
+    result = {"rows": rows, "startup": time_startup(app, path)}
+
+    callbacks = []
+    for city_key, gender_key in itertools.product(
+        filter_combinations(dataset.cities, max_subset),
+        filter_combinations(dataset.genders, max_subset),
+    ):
+        runs = [time_callback(app, city_key, gender_key) for _ in range(repeat)]
+        best = min(runs, key=lambda timings: timings["total"])
+        callbacks.append(
+            {"cities": list(city_key), "genders": list(gender_key), **best}
+        )
+
+    result["callbacks"] = callbacks
+    result["summary"] = summarize(callbacks)
+    return result
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# =======================
+# Ligne de commande
+# =======================
+
+
+def parse_rows(value):
+    return SIZES.get(value.lower()) or int(value)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    gen = commands.add_parser("generate", help="write a synthetic sales CSV")
+    gen.add_argument("--rows", type=parse_rows, required=True)
+    gen.add_argument("--out", required=True)
+    gen.add_argument("--cities", type=int, default=3)
+    gen.add_argument("--genders", type=int, default=2)
+    gen.add_argument("--days", type=int, default=89)
+    gen.add_argument("--seed", type=int, default=0)
+
+    bench = commands.add_parser("run", help="time startup and callbacks")
+    source = bench.add_mutually_exclusive_group(required=True)
+    source.add_argument("--data", nargs="+", help="existing CSV files")
+    source.add_argument(
+        "--rows", nargs="+", type=parse_rows, help="sizes to generate (1k, 1m, ...)"
+    )
+    bench.add_argument("--cities", type=int, default=3)
+    bench.add_argument("--genders", type=int, default=2)
+    bench.add_argument("--repeat", type=int, default=3)
+    bench.add_argument(
+        "--max-subset", type=int, default=3, help="largest filter subset tried"
+    )
+    bench.add_argument("--out", required=True)
+
+    single = commands.add_parser("single", help=argparse.SUPPRESS)
+    single.add_argument("data")
+    single.add_argument("--repeat", type=int, default=3)
+    single.add_argument("--max-subset", type=int, default=3)
+
+    compare = commands.add_parser("compare", help="compare two result files")
+    compare.add_argument("before")
+    compare.add_argument("after")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "generate":
+        generate(args.out, args.rows, args.cities, args.genders, args.days, args.seed)
+
+    elif args.command == "single":
+        with tempfile.TemporaryDirectory() as snapshot_dir:
+            result = run(args.data, args.repeat, args.max_subset, snapshot_dir)
+        json.dump(result, sys.stdout)
+
+    elif args.command == "run":
+        with tempfile.TemporaryDirectory() as workdir:
+            paths = args.data or [
+                generate(
+                    os.path.join(workdir, f"sales_{rows}.csv"),
+                    rows,
+                    args.cities,
+                    args.genders,
+                )
+                for rows in args.rows
+            ]
+            datasets = {}
+            for path in paths:
+                # Un processus par jeu de données : app charge ses données à l'import
+                output = subprocess.run(
+                    [
+                        sys.executable,
+                        os.path.abspath(__file__),
+                        "single",
+                        path,
+                        "--repeat",
+                        str(args.repeat),
+                        "--max-subset",
+                        str(args.max_subset),
+                    ],
+                    capture_output=True,
+                    text=True,
+                    check=True,
+                ).stdout
+                datasets[os.path.basename(path)] = json.loads(output)
+                print(
+                    f"{os.path.basename(path)}: "
+                    f"{datasets[os.path.basename(path)]['summary']['total']['median'] * 1000:.1f} ms "
+                    "(médiane par combinaison)"
+                )
+
+        results = {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "datasets": datasets,
+        }
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+
+    elif args.command == "compare":
+        with open(args.before) as f:
+            before = json.load(f)
+        with open(args.after) as f:
+            after = json.load(f)
+        for name in sorted(set(before["datasets"]) & set(after["datasets"])):
+            print(name)
+            old, new = before["datasets"][name], after["datasets"][name]
+            for stage, stats in old["summary"].items():
+                if stage in new["summary"]:
+                    ratio = new["summary"][stage]["median"] / (stats["median"] or 1)
+                    print(f"  {stage:<10} x{ratio:.2f}")
+            for stage, value in old["startup"].items():
+                if stage in new["startup"]:
+                    print(f"  {stage:<20} x{new['startup'][stage] / (value or 1):.2f}")
+
+
+if __name__ == "__main__":
+    main()
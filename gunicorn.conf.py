@@ -0,0 +1,52 @@
+"""Gunicorn configuration: one copy of the dataset shared by every worker.
+
+The master process publishes the default dataset as memory-mapped column
+files before forking; each worker then maps them read-only instead of
+loading its own copy (other datasets are loaded by each worker). With
+``DASHBOARD_BACKEND=sqlite`` the master ingests the SQLite database
+instead, which the workers open read-only. Run with ``gunicorn app:server``.
+"""
+
+import os
+import subprocess
+import sys
+
+bind = os.environ.get("DASHBOARD_BIND", "0.0.0.0:8080")
+workers = int(os.environ.get("DASHBOARD_WORKERS", "4"))
+# Plusieurs threads par worker : un long export ne bloque pas les callbacks
+threads = int(os.environ.get("DASHBOARD_THREADS", "4"))
+
+SQLITE = os.environ.get("DASHBOARD_BACKEND") == "sqlite"
+
+# /dev/shm est un système de fichiers en mémoire : les pages des colonnes
+# sont partagées par tous les workers
+if os.environ.get("DASHBOARD_SHARED_DIR") is None and not SQLITE:
+    shm = "/dev/shm" if os.path.isdir("/dev/shm") else ".cache"
+    os.environ["DASHBOARD_SHARED_DIR"] = os.path.join(shm, "dashboard-sales")
+
+
+def on_starting(server):
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    # Processus de préparation : ni préchauffage ni suivi des ventes, leurs
+    # résultats seraient perdus à sa sortie
+    env = dict(os.environ, DASHBOARD_WARMUP="0", DASHBOARD_LIVE_SECONDS="0")
+    if SQLITE:
+        # Ingestion une seule fois, avant que les workers n'ouvrent la base
+        server.log.info("Préparation de la base SQLite")
+        subprocess.run(
+            [sys.executable, "-c", "import app"], env=env, check=True, cwd=cwd
+        )
+        return
+
+    shared_dir = os.environ.get("DASHBOARD_SHARED_DIR", "")
+    if not shared_dir:
+        return
+    # Publication dans un processus à part : le maître ne garde pas de copie
+    env["DASHBOARD_SHARED_DIR"] = ""
+    server.log.info("Publication du jeu de données partagé dans %s", shared_dir)
+    subprocess.run(
+        [sys.executable, "-c", f"import app; app.publish_shared({shared_dir!r})"],
+        env=env,
+        check=True,
+        cwd=cwd,
+    )
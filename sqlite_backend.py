@@ -0,0 +1,272 @@
+"""SQLite storage of the sales, for datasets larger than memory.
+
+The CSV is ingested chunk by chunk into a local SQLite file indexed on
+City, Gender and Date. The dashboard then pushes its filters and
+aggregations down to SQL, so only small result sets (the per-day cube,
+histogram bins) reach Python. Enabled with ``DASHBOARD_BACKEND=sqlite``.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+
+import pandas as pd
+
+# Version du schéma (à incrémenter si ingest change)
+SCHEMA_VERSION = 1
+
+# Taille de la projection mémoire des connexions en lecture (octets)
+MMAP_SIZE = 256 * 1024 * 1024
+
+# Connexions en lecture seule, une par thread et par fichier
+_local = threading.local()
+
+
+def quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+# =======================
+# Ingestion
+# =======================
+
+
+def read_meta(db_path):
+    if not os.path.exists(db_path):
+        return {}
+    try:
+        with sqlite3.connect(f"file:{db_path}?mode=ro", uri=True) as conn:
+            rows = conn.execute("SELECT key, value FROM meta").fetchall()
+    except sqlite3.DatabaseError:
+        return {}
+    return {key: json.loads(value) for key, value in rows}
+
+
+def ingest(chunks, db_path, columns, indexes, source):
+    """Write the DataFrames of ``chunks`` into the ``sales`` table of ``db_path``.
+
+    ``columns`` lists the columns to store, ``indexes`` those to index and
+    ``source`` is recorded in the ``meta`` table. Dates are stored as ISO
+    days, categories as text. The database is built in a temporary file
+    then renamed, so readers never see a partial one. Returns the meta.
+    """
+    tmp = f"{db_path}.{os.getpid()}.tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    conn = sqlite3.connect(tmp)
+    try:
+        # Base reconstruite en entier en cas d'échec : pas de journal
+        conn.execute("PRAGMA journal_mode = OFF")
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.execute(
+            f"CREATE TABLE sales ({', '.join(quote(column) for column in columns)})"
+        )
+        insert = f"INSERT INTO sales VALUES ({', '.join('?' for _ in columns)})"
+
+        order = {}
+        first = last = None
+        rows = 0
+        for chunk in chunks:
+            if chunk.empty:
+                continue
+            # Ordre d'apparition des valeurs, cumulé d'un morceau à l'autre
+            for column in chunk.columns:
+                if isinstance(chunk[column].dtype, pd.CategoricalDtype):
+                    seen = order.setdefault(column, [])
+                    known = set(seen)
+                    seen += [v for v in chunk[column].unique() if v not in known]
+            dates = chunk["Date"]
+            first = dates.min() if first is None else min(first, dates.min())
+            last = dates.max() if last is None else max(last, dates.max())
+
+            chunk = chunk[columns].copy()
+            chunk["Date"] = dates.dt.strftime("%Y-%m-%d")
+            for column in chunk.columns:
+                if isinstance(chunk[column].dtype, pd.CategoricalDtype):
+                    chunk[column] = chunk[column].astype(str)
+            conn.executemany(insert, chunk.itertuples(index=False, name=None))
+            rows += len(chunk)
+
+        for column in indexes:
+            conn.execute(
+                f"CREATE INDEX {quote('idx_' + column)} ON sales ({quote(column)})"
+            )
+        meta = dict(
+            source,
+            version=SCHEMA_VERSION,
+            rows=rows,
+            order=order,
+            dates=[
+                None if first is None else first.isoformat(),
+                None if last is None else last.isoformat(),
+            ],
+        )
+        conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+        conn.executemany(
+            "INSERT INTO meta VALUES (?, ?)",
+            [(key, json.dumps(value)) for key, value in meta.items()],
+        )
+        conn.execute("ANALYZE")
+        conn.commit()
+    finally:
+        conn.close()
+    os.replace(tmp, db_path)
+    return meta
+
+
+# =======================
+# Requêtes
+# =======================
+
+
+def connection(db_path):
+    """Read-only connection of the current thread to ``db_path``.
+
+    Connections are opened once per thread and reopened after a fork or
+    when the file has been replaced by a new ingestion.
+    """
+    pid, inode = os.getpid(), os.stat(db_path).st_ino
+    if getattr(_local, "pid", None) != pid:
+        _local.pid, _local.connections = pid, {}
+    conn, conn_inode = _local.connections.get(db_path, (None, None))
+    if conn is None or conn_inode != inode:
+        if conn is not None:
+            conn.close()
+        conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+        conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+        _local.connections[db_path] = (conn, inode)
+    return conn
+
+
+def where_clause(restrictions, date_key):
+    """SQL condition and parameters of ``restrictions`` and ``date_key``."""
+    conditions, params = [], []
+    for dim, values in restrictions:
+        conditions.append(f"{quote(dim)} IN ({', '.join('?' for _ in values)})")
+        params += list(values)
+    if date_key:
+        conditions.append('"Date" BETWEEN ? AND ?')
+        params += list(date_key)
+    if not conditions:
+        return "", params
+    return "WHERE " + " AND ".join(conditions), params
+
+
+def query_cube(db_path, restrictions, date_key, keys, invoice="Invoice ID"):
+    """Cube rows (``Total``, ``Invoices``, ``DistinctInvoices``) per ``keys``.
+
+    Same layout as ``app.build_cube``, already filtered and sorted by date.
+    """
+    where, params = where_clause(restrictions, date_key)
+    group = ", ".join(quote(key) for key in keys)
+    data = pd.read_sql_query(
+        f'SELECT {group}, SUM("Total") AS "Total", '
+        f'COUNT({quote(invoice)}) AS "Invoices", '
+        f'COUNT(DISTINCT {quote(invoice)}) AS "DistinctInvoices" '
+        f"FROM sales {where} GROUP BY {group} ORDER BY {group}",
+        connection(db_path),
+        params=params,
+    )
+    data["Date"] = pd.to_datetime(data["Date"])
+    return data
+
+
+def total_stats(db_path, restrictions, date_key, distinct_limit):
+    """Count, bounds, standard deviation and integrality of ``Total``.
+
+    The distinct values are returned, sorted, when there are at most
+    ``distinct_limit`` rows, otherwise ``None``.
+    """
+    conn = connection(db_path)
+    where, params = where_clause(restrictions, date_key)
+    count, low, high, mean = conn.execute(
+        f'SELECT COUNT(*), MIN("Total"), MAX("Total"), AVG("Total") '
+        f"FROM sales {where}",
+        params,
+    ).fetchone()
+    if not count:
+        return {"count": 0}
+    # Variance en deux passes, plus stable que E[x²] - E[x]²
+    variance, fractional = conn.execute(
+        f'SELECT AVG(("Total" - ?) * ("Total" - ?)), '
+        f'SUM("Total" != CAST("Total" AS INTEGER)) FROM sales {where}',
+        [mean, mean] + params,
+    ).fetchone()
+    distinct = None
+    if count <= distinct_limit:
+        distinct = [
+            value
+            for (value,) in conn.execute(
+                f'SELECT DISTINCT "Total" FROM sales {where} ORDER BY "Total"',
+                params,
+            )
+        ]
+    return {
+        "count": count,
+        "min": low,
+        "max": high,
+        "std": variance**0.5,
+        "integers": not fractional,
+        "distinct": distinct,
+    }
+
+
+def near_edge_count(db_path, restrictions, date_key, offset, start, size):
+    """Number of ``Total + offset`` within 2% of a bin edge.
+
+    Same test as ``app.near_edge``; values are never below ``start``, so
+    truncation gives the floor of the modulo.
+    """
+    where, params = where_clause(restrictions, date_key)
+    position = '(1 + ("Total" + ? - ?) * 100.0 / ?)'
+    (count,) = (
+        connection(db_path)
+        .execute(
+            f"SELECT COUNT(*) FROM sales {where} {'AND' if where else 'WHERE'} "
+            f"{position} - 100 * CAST({position} / 100 AS INTEGER) < 2",
+            params + [offset, start, size] * 2,
+        )
+        .fetchone()
+    )
+    return count
+
+
+def binned_counts(db_path, restrictions, date_key, group_vars, start, size, nbins):
+    """Row count per ``group_vars`` values and ``Total`` bin."""
+    where, params = where_clause(restrictions, date_key)
+    group = "".join(f"{quote(var)}, " for var in group_vars)
+    return (
+        connection(db_path)
+        .execute(
+            f'SELECT {group}MIN(MAX(CAST(("Total" - ?) / ? AS INTEGER), 0), ?) '
+            f"AS bin, COUNT(*) FROM sales {where} GROUP BY {group}bin",
+            [start, size, nbins - 1] + params,
+        )
+        .fetchall()
+    )
+
+
+def iter_rows(db_path, restrictions, date_key, columns, chunk_rows):
+    """``columns`` of the matching rows, by date, ``chunk_rows`` at a time.
+
+    A connection of its own is used, so a long export does not hold the
+    connection of the thread; a sort too large for memory spills to disk.
+    """
+    where, params = where_clause(restrictions, date_key)
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        cursor = conn.execute(
+            f"SELECT {', '.join(quote(column) for column in columns)} "
+            f'FROM sales {where} ORDER BY "Date"',
+            params,
+        )
+        while True:
+            rows = cursor.fetchmany(chunk_rows)
+            if not rows:
+                break
+            data = pd.DataFrame(rows, columns=columns)
+            data["Date"] = pd.to_datetime(data["Date"])
+            yield data
+    finally:
+        conn.close()
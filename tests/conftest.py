@@ -0,0 +1,59 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_PATH = os.path.join(ROOT, "supermarket_sales.csv")
+
+# Avant l'import de app : jeu de données fourni, ni instantanés ni préchauffage
+os.environ.setdefault("DASHBOARD_DATA", DATA_PATH)
+os.environ["DASHBOARD_SNAPSHOT_DIR"] = ""
+os.environ["DASHBOARD_WARMUP"] = "0"
+sys.path.insert(0, ROOT)
+
+import app  # noqa: E402
+
+
+def same_rows(data, expected):
+    """Same rows, in the same order, whatever the dtypes (categories, ...)."""
+    assert list(data.columns) == list(expected.columns)
+    for name in expected.columns:
+        values, reference = data[name], expected[name]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            values = values.astype(object)
+        if isinstance(reference.dtype, pd.CategoricalDtype):
+            reference = reference.astype(object)
+        assert values.tolist() == reference.tolist(), name
+
+
+# Sélections comparées à leur calcul direct avec pandas
+SELECTIONS = [
+    ({}, ()),
+    ({"City": ["Yangon"]}, ()),
+    ({"City": ["Yangon", "Mandalay"], "Gender": ["Female"]}, ()),
+    ({"Payment": ["Cash"], "Product line": ["Health and beauty"]}, ()),
+    ({"Customer type": ["Member"]}, ("2019-02-01", "2019-02-28")),
+    ({"City": ["Naypyitaw"], "Branch": ["A"]}, ()),
+    ({}, ("2019-03-10", "2019-03-10")),
+]
+
+
+@pytest.fixture(scope="session")
+def sales():
+    """The bundled CSV, read and sorted by date in the most direct way."""
+    data = pd.read_csv(DATA_PATH, usecols=app.USECOLS)
+    data["Date"] = pd.to_datetime(data["Date"])
+    return data.sort_values("Date", kind="stable", ignore_index=True)
+
+
+def expected_rows(sales, filters, date_key):
+    mask = np.ones(len(sales), dtype=bool)
+    for dim, values in filters.items():
+        mask &= sales[dim].isin(values).to_numpy()
+    if date_key:
+        first, last = pd.Timestamp(date_key[0]), pd.Timestamp(date_key[1])
+        mask &= ((sales["Date"] >= first) & (sales["Date"] <= last)).to_numpy()
+    return sales[mask]
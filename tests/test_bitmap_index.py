@@ -0,0 +1,36 @@
+import numpy as np
+
+import app
+
+
+def test_bitmap_index_matches_pandas(sales):
+    dataset = app.get_dataset()
+    df = dataset.df
+    for dim, bitsets in dataset.bitmap_index.items():
+        assert set(bitsets) == set(sales[dim].unique())
+        for value, bits in bitsets.items():
+            mask = np.unpackbits(bits, count=len(df)).view(bool)
+            assert (mask == (df[dim] == value).to_numpy()).all()
+
+
+def test_select_rows_matches_pandas(sales):
+    dataset = app.get_dataset()
+    df = dataset.df
+    filters = {"City": ["Yangon", "Mandalay"], "Payment": ["Cash"]}
+    selection = app.select_rows(dataset, filters)
+    expected = np.ones(len(df), dtype=bool)
+    for dim, values in filters.items():
+        expected &= df[dim].isin(values).to_numpy()
+    assert (np.unpackbits(selection, count=len(df)).view(bool) == expected).all()
+    # Toutes les valeurs d'une dimension : aucune restriction
+    assert app.select_rows(dataset, {"Gender": list(df["Gender"].unique())}) is None
+
+
+def test_selection_mask_slices():
+    rng = np.random.default_rng(0)
+    mask = rng.random(1_003) < 0.3
+    selection = np.packbits(mask)
+    for start, stop in [(0, 1_003), (5, 17), (8, 16), (1_000, 1_003), (9, 4)]:
+        assert (
+            app.selection_mask(selection, start, stop) == mask[start : max(stop, start)]
+        ).all()
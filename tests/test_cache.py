@@ -0,0 +1,34 @@
+import shutil
+from collections import OrderedDict
+
+import app
+from conftest import DATA_PATH
+
+
+def test_reload_discards_only_its_dataset(tmp_path, monkeypatch):
+    path = tmp_path / "other.csv"
+    shutil.copy(DATA_PATH, path)
+    default = app.get_dataset()
+    monkeypatch.setattr(app, "DATASETS", OrderedDict({default.name: default}))
+    monkeypatch.setattr(app, "CACHED_FUNCTIONS", list(app.CACHED_FUNCTIONS))
+    app.store_dataset(app.load_dataset("other", str(path)))
+    calls = []
+
+    @app.memoize
+    def probe(name, key):
+        calls.append((name, key))
+        return len(app.get_dataset(name).df)
+
+    for name in (default.name, "other"):
+        for key in range(3):
+            probe(name, key)
+    assert probe.cache_info()["size"] == 6
+
+    # Rechargement de « other » : seuls ses résultats sont retirés
+    app.store_dataset(app.load_dataset("other", str(path)))
+    assert probe.cache_info()["size"] == 3
+    calls.clear()
+    for name in (default.name, "other"):
+        for key in range(3):
+            probe(name, key)
+    assert calls == [("other", key) for key in range(3)]
@@ -0,0 +1,62 @@
+import io
+
+import pandas as pd
+import pytest
+
+import app
+
+
+@pytest.fixture(scope="module")
+def dataset():
+    return app.get_dataset()
+
+
+def exported(**query):
+    response = app.server.test_client().get("/export", query_string=query)
+    assert response.status_code == 200
+    return pd.read_csv(io.BytesIO(response.data), parse_dates=["Date"])
+
+
+@pytest.mark.parametrize(
+    "start,end,key",
+    [
+        (None, None, ()),
+        ("garbage", "", ()),
+        ("2019-02-01", "2019-02-28", ("2019-02-01", "2019-02-28")),
+        # Bornes inversées : échangées
+        ("2019-02-28", "2019-02-01", ("2019-02-01", "2019-02-28")),
+        ("2019-02-01T13:45:00", None, ("2019-02-01", "2019-03-30")),
+        # Fuseau horaire : jour écrit dans la valeur
+        ("2019-01-05T00:00:00+02:00", None, ("2019-01-05", "2019-03-30")),
+        (
+            "2019-01-05T23:00:00-05:00",
+            "2019-02-01T08:00:00Z",
+            ("2019-01-05", "2019-02-01"),
+        ),
+        # Hors des données : premier jour après le dernier
+        ("2020-01-01", "2020-02-01", ("2020-01-01", "2019-03-30")),
+    ],
+)
+def test_canonical_dates(dataset, start, end, key):
+    assert app.canonical_dates(dataset, start, end) == key
+
+
+def test_range_outside_data_is_empty(dataset):
+    key = app.canonical_dates(dataset, "2020-01-01", "2020-02-01")
+    start, stop = app.date_slice(dataset.df["Date"], key)
+    assert start == stop
+    restrictions = (("City", ("Yangon",)),)
+    assert app.filtered_rows(dataset.name, restrictions, key).empty
+    assert exported(City="Yangon", start="2020-02-01", end="2020-01-01").empty
+
+
+def test_export_with_time_zone():
+    data = exported(start="2019-01-05T00:00:00+02:00", end="2019-01-06")
+    assert not data.empty
+    assert data["Date"].between("2019-01-05", "2019-01-06").all()
+
+
+def test_state_keys_with_time_zone(dataset):
+    keys = app.state_keys({"start": "2019-01-05T00:00:00+02:00", "filters": {}})
+    assert keys[2] == ("2019-01-05", "2019-03-30")
+    assert app.kpi_texts(*app.filter_context(*keys)["data_key"])
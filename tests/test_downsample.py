@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import app
+
+
+def test_downsample_keeps_every_point_when_small():
+    x = np.arange(50)
+    assert app.downsample(x, np.zeros(50), 25).tolist() == list(range(50))
+
+
+@pytest.mark.parametrize("window", [(None, None), (2_000, 7_000)])
+def test_downsample_keeps_extremes_of_each_column(window):
+    rng = np.random.default_rng(0)
+    x = np.sort(rng.choice(10_000, 5_000, replace=False))
+    y = rng.normal(size=len(x))
+    buckets = 100
+    start, stop = window
+    kept = app.downsample(x, y, buckets, start, stop)
+
+    # Points visibles et leur voisin de chaque côté, comme pandas les choisit
+    visible = pd.Series(True, index=range(len(x)))
+    if start is not None:
+        visible &= (x >= start) | (np.arange(len(x)) == np.searchsorted(x, start) - 1)
+        visible &= (x <= stop) | (
+            np.arange(len(x)) == np.searchsorted(x, stop, side="right")
+        )
+    positions = np.flatnonzero(visible.to_numpy())
+    assert kept[0] == positions[0] and kept[-1] == positions[-1]
+    assert np.all(np.diff(kept) > 0)
+    assert len(kept) <= 2 * buckets + 2
+
+    points = pd.DataFrame({"x": x[positions], "y": y[positions]}, index=positions)
+    span = points["x"].iloc[-1] - points["x"].iloc[0] + 1
+    column = (points["x"] - points["x"].iloc[0]) * buckets // span
+    extremes = set(points.groupby(column)["y"].idxmin()) | set(
+        points.groupby(column)["y"].idxmax()
+    )
+    assert set(kept) == extremes | {positions[0], positions[-1]}
+
+
+def test_visible_points_by_city():
+    # Une série par ville, chacune décimée à part
+    days = pd.date_range("2019-01-01", periods=1_000, freq="D")
+    period_sales = pd.DataFrame(
+        {
+            "Period": np.tile(days, 2),
+            "City": np.repeat(["Yangon", "Mandalay"], len(days)),
+            "Total": np.random.default_rng(0).normal(size=2 * len(days)),
+        }
+    )
+    visible = app.visible_points(period_sales, (), 100)
+    assert visible["City"].unique().tolist() == ["Yangon", "Mandalay"]
+    for city, rows in visible.groupby("City"):
+        series = period_sales[period_sales["City"] == city]
+        assert rows["Total"].max() == series["Total"].max()
+        assert rows["Total"].min() == series["Total"].min()
+        assert len(rows) <= 2 * 100 + 2
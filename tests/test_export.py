@@ -0,0 +1,63 @@
+import io
+
+import pandas as pd
+import pytest
+
+import app
+from conftest import DATA_PATH
+
+
+@pytest.fixture
+def sales_csv(tmp_path):
+    path = tmp_path / "sales.csv"
+    path.write_bytes(open(DATA_PATH, "rb").read())
+    return str(path)
+
+
+def exported(dataset, monkeypatch, **query):
+    """CSV of ``/export`` for ``dataset``, in place of the one of its name."""
+    monkeypatch.setitem(app.DATASETS, dataset.name, dataset)
+    response = app.server.test_client().get(
+        "/export", query_string=dict(query, dataset=dataset.name)
+    )
+    assert response.status_code == 200
+    return pd.read_csv(io.BytesIO(response.data))
+
+
+def check_export(data):
+    expected = pd.read_csv(DATA_PATH, usecols=app.USECOLS)
+    expected = expected[expected["City"] == "Yangon"]
+    assert list(data.columns) == app.USECOLS
+    assert sorted(data["Invoice ID"]) == sorted(expected["Invoice ID"])
+    merged = data.merge(expected, on="Invoice ID", suffixes=("", "_expected"))
+    assert (merged["Total"] == merged["Total_expected"]).all()
+
+
+def test_export_in_memory(sales_csv, monkeypatch):
+    dataset = app.load_dataset("sales", sales_csv)
+    check_export(exported(dataset, monkeypatch, City="Yangon"))
+
+
+def test_export_streamed(sales_csv, tmp_path, monkeypatch):
+    monkeypatch.setattr(app, "STREAM_THRESHOLD_MB", "0")
+    monkeypatch.setattr(app, "SNAPSHOT_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr(app, "INGEST_CHUNK_ROWS", 137)
+    dataset = app.load_dataset("sales", sales_csv)
+    assert "Invoice ID" not in dataset.df
+    check_export(exported(dataset, monkeypatch, City="Yangon"))
+
+
+@pytest.mark.parametrize("threshold", ["", "0"])
+def test_export_shared(sales_csv, tmp_path, monkeypatch, threshold):
+    # Publication d'un jeu de données chargé en mémoire ou par morceaux
+    monkeypatch.setattr(app, "STREAM_THRESHOLD_MB", threshold)
+    monkeypatch.setattr(app, "SNAPSHOT_DIR", str(tmp_path / "cache"))
+    published = app.load_dataset("sales", sales_csv)
+    monkeypatch.setattr(app, "get_dataset", lambda name=None: published)
+    app.publish_shared(str(tmp_path / "shared"))
+    monkeypatch.undo()
+
+    monkeypatch.setattr(app, "SHARED_DIR", str(tmp_path / "shared"))
+    dataset = app.load_dataset(app.DEFAULT_DATASET, sales_csv)
+    assert dataset.shared
+    check_export(exported(dataset, monkeypatch, City="Yangon"))
@@ -0,0 +1,34 @@
+import pytest
+
+import app
+from conftest import SELECTIONS, expected_rows, same_rows
+
+
+@pytest.mark.parametrize("filters,date_key", SELECTIONS)
+def test_filtered_rows_match_pandas(sales, filters, date_key):
+    restrictions = tuple((dim, tuple(values)) for dim, values in filters.items())
+    rows = app.filtered_rows(app.DEFAULT_DATASET, restrictions, date_key)
+    expected = expected_rows(sales, filters, date_key)
+    same_rows(rows.reset_index(drop=True), expected.reset_index(drop=True))
+
+
+@pytest.mark.parametrize("filters,date_key", SELECTIONS)
+def test_kpis_match_pandas(sales, filters, date_key):
+    restrictions = tuple((dim, tuple(values)) for dim, values in filters.items())
+    total_sales, total_invoices = app.kpi_texts(
+        app.DEFAULT_DATASET, restrictions, date_key
+    )
+    expected = expected_rows(sales, filters, date_key)
+    assert total_sales == f"{expected['Total'].sum():,.2f}".replace(",", " ") + " USD"
+    assert total_invoices == f"{expected['Invoice ID'].nunique():,.0f}".replace(
+        ",", " "
+    )
+
+
+def test_dimension_outside_the_cube(sales):
+    # Payment n'est pas une clé du cube : cube des dimensions actives
+    restrictions = (("Payment", ("Ewallet",)), ("Product line", ("Sports and travel",)))
+    filtered = app.filtered_data(app.DEFAULT_DATASET, restrictions, ())
+    expected = expected_rows(sales, {dim: list(v) for dim, v in restrictions}, ())
+    assert filtered["Invoices"].sum() == len(expected)
+    assert round(filtered["Total"].sum(), 6) == round(expected["Total"].sum(), 6)
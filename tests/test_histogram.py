@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import app
+from conftest import SELECTIONS, expected_rows
+
+
+@pytest.mark.parametrize("filters,date_key", SELECTIONS)
+def test_histogram_counts_match_pandas(sales, filters, date_key):
+    expected = expected_rows(sales, filters, date_key)
+    data = expected.astype({name: "category" for name in app.CATEGORICAL_COLUMNS})
+    orders = {name: sales[name].unique().tolist() for name in app.CATEGORICAL_COLUMNS}
+    hist = app.histogram_counts(data, "Gender", "City", orders)
+    if expected.empty:
+        assert hist is None
+        return
+
+    values = expected["Total"].to_numpy()
+    edges, size = hist["edges"], hist["size"]
+    # Largeur « ronde » (1, 2 ou 5 × 10^k) et classes couvrant les valeurs
+    mantissa = size / 10 ** np.floor(np.log10(size))
+    assert min(abs(mantissa - step) for step in (1, 2, 5, 10)) < 1e-9
+    assert np.allclose(np.diff(edges), size)
+    assert edges[0] <= values.min() < edges[1]
+    assert edges[-2] <= values.max() < edges[-1]
+
+    # Effectifs de chaque (genre, ville), dans l'ordre d'apparition
+    assert hist["group_vars"] == ["Gender", "City"]
+    present = {
+        var: [value for value in orders[var] if value in set(expected[var])]
+        for var in ("Gender", "City")
+    }
+    assert hist["group_values"] == [present["Gender"], present["City"]]
+    groups = pd.MultiIndex.from_product(hist["group_values"])
+    for (gender, city), counts in zip(groups, hist["counts"]):
+        group = expected[(expected["Gender"] == gender) & (expected["City"] == city)]
+        reference, _ = np.histogram(group["Total"], bins=edges)
+        assert counts.tolist() == reference.tolist()
+
+
+def test_autobin_follows_plotly():
+    # Valeurs entières : bornes décalées d'une demi-unité
+    start, size, nbins = app.histogram_bins(np.arange(1.0, 101.0))
+    assert (start, size, nbins) == (-0.5, 10.0, 11)
+    # Une seule valeur : une classe, qui la contient
+    start, size, nbins = app.histogram_bins(np.array([42.5]))
+    assert nbins == 1 and start <= 42.5 < start + size
@@ -0,0 +1,126 @@
+import os
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import app
+from conftest import DATA_PATH, same_rows
+
+
+def write_lines(path, lines):
+    with open(path, "a", newline="") as f:
+        f.write("".join(lines))
+
+
+@pytest.fixture
+def live_csv(tmp_path):
+    """A copy of the bundled CSV split in a loaded head and appended lines.
+
+    The lines are sorted by date, so appends take the fast path
+    (``extend_dataset``), except when the test shuffles them.
+    """
+    with open(DATA_PATH, newline="") as f:
+        header, *lines = f.read().splitlines(keepends=True)
+    lines[-1] = lines[-1].rstrip("\r\n") + "\n"
+    dates = pd.to_datetime(pd.Series([line.split(",")[10] for line in lines]))
+    lines = [lines[i] for i in np.argsort(dates.to_numpy(), kind="stable")]
+    path = tmp_path / "live.csv"
+    write_lines(path, [header] + lines[:600])
+    return str(path), lines[600:]
+
+
+def check_dataset(dataset, path):
+    """``dataset`` as a full reload of ``path`` would build it."""
+    expected = app.parse_sales(path)
+    same_rows(dataset.df, expected)
+    expected_cube = app.build_cube(expected)
+    same_rows(dataset.cube.reset_index(drop=True), expected_cube.reset_index(drop=True))
+    reference = app.build_bitmap_index(expected, app.FILTER_DIMENSIONS)
+    for dim, bitsets in reference.items():
+        assert set(dataset.bitmap_index[dim]) == set(bitsets)
+        for value, bits in bitsets.items():
+            count = len(expected)
+            assert (
+                np.unpackbits(dataset.bitmap_index[dim][value], count=count)
+                == np.unpackbits(bits, count=count)
+            ).all(), (dim, value)
+    for dim in app.FILTER_DIMENSIONS:
+        assert dataset.dimension_values[dim] == expected.attrs["order"][dim]
+
+
+def test_live_appends_match_full_reload(live_csv):
+    path, lines = live_csv
+    dataset = app.load_dataset("live", path)
+    app.follow(dataset)
+    for batch in (lines[:1], lines[1:150], lines[150:151], lines[151:]):
+        write_lines(path, batch)
+        app.ingest_new_sales(dataset)
+        # Tampons repris d'un ajout à l'autre
+        assert dataset.live["buffers"]
+        check_dataset(dataset, path)
+
+
+def test_live_tail_waits_for_complete_lines(live_csv):
+    path, lines = live_csv
+    dataset = app.load_dataset("live", path)
+    app.follow(dataset)
+    rows = len(dataset.df)
+    line = lines[0]
+    write_lines(path, [line[:20]])
+    app.ingest_new_sales(dataset)
+    assert len(dataset.df) == rows
+    write_lines(path, [line[20:]])
+    app.ingest_new_sales(dataset)
+    assert len(dataset.df) == rows + 1
+    check_dataset(dataset, path)
+
+
+def test_live_appends_out_of_order_rebuild(live_csv):
+    path, lines = live_csv
+    dataset = app.load_dataset("live", path)
+    app.follow(dataset)
+    write_lines(path, lines[-50:])
+    app.ingest_new_sales(dataset)
+    # Ventes antérieures à la dernière date : reconstruction complète
+    write_lines(path, lines[:50])
+    app.ingest_new_sales(dataset)
+    check_dataset(dataset, path)
+
+
+def test_live_reload_when_rewritten(live_csv, monkeypatch):
+    path, lines = live_csv
+    dataset = app.load_dataset("live", path)
+    app.follow(dataset)
+    stored = []
+    monkeypatch.setattr(app, "store_dataset", stored.append)
+    with open(path, "r+") as f:
+        f.truncate(os.path.getsize(path) // 2)
+    app.ingest_new_sales(dataset)
+    assert len(stored) == 1
+
+
+def test_live_appends_update_memory_and_budget(live_csv, monkeypatch):
+    path, lines = live_csv
+    dataset = app.load_dataset("live", path)
+    other = app.load_dataset("other", DATA_PATH)
+    # « other » est le moins récemment utilisé ; les deux tiennent au départ
+    monkeypatch.setattr(app, "DATASETS", OrderedDict(other=other, live=dataset))
+    monkeypatch.setattr(app, "EVICTED", set())
+    budget = dataset.nbytes + other.nbytes
+    monkeypatch.setattr(app, "DATASET_BUDGET_MB", budget / 2**20)
+    loaded_bytes = dataset.nbytes
+    app.follow(dataset)
+    write_lines(path, lines)
+    app.ingest_new_sales(dataset)
+
+    # Capacité des tampons comprise : au moins la mémoire d'un rechargement
+    reloaded = app.load_dataset("live", path)
+    assert dataset.nbytes > loaded_bytes
+    assert dataset.nbytes >= reloaded.nbytes
+    assert dataset.nbytes == app.dataset_bytes(dataset)
+    labels = (("dataset", "live"),)
+    assert app.GAUGES["dashboard_dataset_bytes"][labels] == dataset.nbytes
+    assert list(app.DATASETS) == ["live"]
+    assert app.EVICTED == {"other"}
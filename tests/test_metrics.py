@@ -0,0 +1,35 @@
+import os
+import re
+
+import app
+
+# Ligne d'une série du format texte : nom{clé="valeur",...} nombre
+SAMPLE = re.compile(
+    r"^[a-zA-Z_:][a-zA-Z0-9_:]*"
+    r'(\{[a-zA-Z_][a-zA-Z0-9_]*="(?:[^"\\\n]|\\[\\"n])*"'
+    r'(?:,[a-zA-Z_][a-zA-Z0-9_]*="(?:[^"\\\n]|\\[\\"n])*")*\})? \S+$'
+)
+
+
+def test_label_values_are_escaped(monkeypatch):
+    monkeypatch.setattr(app, "COUNTERS", {})
+    monkeypatch.setattr(app, "GAUGES", {})
+    monkeypatch.setattr(app, "HISTOGRAMS", {})
+    name = 'ventes "Q1"\\2019\nbis'
+    app.increment("dashboard_dataset_loads_total", (("dataset", name),))
+    app.set_gauge("dashboard_dataset_bytes", (("dataset", name),), 10)
+    app.observe("dashboard_stage_seconds", (("stage", name),), 0.2)
+
+    text = app.render_metrics()
+    for line in text.splitlines():
+        assert line.startswith("# TYPE ") or SAMPLE.match(line), line
+    assert 'dataset="ventes \\"Q1\\"\\\\2019\\nbis"' in text
+
+
+def test_series_carry_the_pid(monkeypatch):
+    monkeypatch.setattr(app, "COUNTERS", {})
+    monkeypatch.setattr(app, "GAUGES", {})
+    monkeypatch.setattr(app, "HISTOGRAMS", {})
+    app.increment("dashboard_exports_total", (("format", "csv"),))
+    text = app.render_metrics()
+    assert f'dashboard_exports_total{{format="csv",pid="{os.getpid()}"}} 1' in text
@@ -0,0 +1,87 @@
+import os
+import json
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import app
+from conftest import DATA_PATH, same_rows
+
+
+@pytest.fixture
+def timed_csv(tmp_path):
+    """The bundled CSV with times of day and missing dates."""
+    data = pd.read_csv(DATA_PATH)
+    rng = np.random.default_rng(0)
+    hours = pd.Series(rng.integers(0, 24, len(data))).astype(str)
+    data["Date"] = data["Date"] + " " + hours + ":00"
+    data.loc[rng.choice(len(data), 20, replace=False), "Date"] = np.nan
+    path = tmp_path / "sales.csv"
+    data.to_csv(path, index=False)
+    return str(path)
+
+
+def check_streamed(loaded, path):
+    df, cube, text_columns = loaded
+    expected = app.parse_sales(path)
+    invoices = np.char.decode(np.asarray(text_columns["Invoice ID"]), "utf-8")
+    same_rows(df.assign(**{"Invoice ID": invoices})[app.USECOLS], expected)
+    same_rows(cube, app.build_cube(expected))
+
+
+@pytest.mark.parametrize("chunk_rows", [7, 137, 500_000])
+def test_stream_sales_matches_parse_sales(tmp_path, monkeypatch, timed_csv, chunk_rows):
+    # Heures et dates manquantes : tri dans chaque jour, manquantes en dernier
+    monkeypatch.setattr(app, "INGEST_CHUNK_ROWS", chunk_rows)
+    directory = tmp_path / "columns"
+    check_streamed(app.stream_sales(timed_csv, str(directory)), timed_csv)
+    assert not [file for file in os.listdir(directory) if file.endswith(".spill")]
+
+
+def test_concurrent_stream_sales(tmp_path, monkeypatch, timed_csv):
+    # Lectures lentes : sans verrou, chacun supprimerait les fichiers des autres
+    read_chunks = app.read_chunks
+
+    def slow_chunks(path):
+        for chunk in read_chunks(path):
+            time.sleep(0.01)
+            yield chunk
+
+    spill_sales = app.spill_sales
+    spills = []
+
+    def counted_spill(*args):
+        spills.append(args)
+        spill_sales(*args)
+
+    monkeypatch.setattr(app, "read_chunks", slow_chunks)
+    monkeypatch.setattr(app, "spill_sales", counted_spill)
+    monkeypatch.setattr(app, "INGEST_CHUNK_ROWS", 100)
+    directory = str(tmp_path / "columns")
+    results, errors = [], []
+
+    def load():
+        try:
+            results.append(app.stream_sales(timed_csv, directory))
+        except Exception as error:
+            errors.append(error)
+
+    threads = [threading.Thread(target=load) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    for loaded in results:
+        check_streamed(loaded, timed_csv)
+    # Une seule écriture, les autres chargements projettent ses fichiers
+    assert len(spills) == 1
+    with open(os.path.join(directory, "manifest.json")) as f:
+        generation = json.load(f)["cube"].rsplit("-cube", 1)[0]
+    assert all(
+        file in ("manifest.json", "lock") or file.startswith(generation)
+        for file in os.listdir(directory)
+    )